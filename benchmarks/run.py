@@ -0,0 +1,336 @@
+"""
+Benchmarks of decouple_extended, runnable offline: AWS is mocked with moto, behind a client adding latency
+and throttling errors on demand.
+
+    python -m benchmarks.run [--output bench.json] [--latency-ms 5] [--throttle-rate 0.1] [--filter env]
+
+Results are emitted as JSON (timings in microseconds), so runs of different releases can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from contextlib import ExitStack
+
+# moto needs fake credentials and a region, and nothing here may reach the real AWS
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmarks")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmarks")
+
+import boto3  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+from decouple import Config  # noqa: E402
+from moto import mock_secretsmanager  # noqa: E402
+from moto import mock_ssm  # noqa: E402
+from pydantic import create_model  # noqa: E402
+
+from decouple_extended import CRUDRepositoryAWSParameterStore  # noqa: E402
+from decouple_extended import CRUDRepositoryAWSSecrets  # noqa: E402
+from decouple_extended import CRUDRepositoryEnv  # noqa: E402
+from decouple_extended import CRUDRepositoryIni  # noqa: E402
+from decouple_extended import RepositoryAWSParameterStore  # noqa: E402
+from decouple_extended import RepositoryAWSSecrets  # noqa: E402
+from decouple_extended.extensions import ConfigByModel  # noqa: E402
+from decouple_extended.extensions import field_model_registry  # noqa: E402
+from decouple_extended.observers import InMemoryObserver  # noqa: E402
+
+
+MODEL_SIZES = (10, 100)
+BULK_SIZE = 50
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+class LatencyClient:
+    """
+    Wraps a boto3 client, sleeping latency seconds before every call and failing a throttle_rate
+    share of them with a ThrottlingException, like a loaded AWS endpoint would.
+    """
+
+    def __init__(self, client, latency=0.0, throttle_rate=0.0, seed=0):
+        self.client = client
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        if not callable(method):
+            return method
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            if self.latency:
+                time.sleep(self.latency)
+            if self.throttle_rate and self._random.random() < self.throttle_rate:
+                raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, name)
+            return method(*args, **kwargs)
+
+        return call
+
+
+class Runner:
+    def __init__(self, repeat, latency, throttle_rate, name_filter=None):
+        self.repeat = repeat
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.name_filter = name_filter
+        self.results = []
+
+    def client(self, service_name):
+        return LatencyClient(boto3.client(service_name), self.latency, self.throttle_rate)
+
+    def measure(self, name, func, setup=None, repeat=None, **params):
+        """Time func (called with what setup returns, if given) repeat times and keep the statistics"""
+        if self.name_filter and self.name_filter not in name:
+            return
+
+        timings = []
+        errors = 0
+        for _ in range(repeat or self.repeat):
+            args = (setup(),) if setup is not None else ()
+            start = time.perf_counter()
+            try:
+                func(*args)
+            except Exception:
+                errors += 1
+                continue
+            timings.append((time.perf_counter() - start) * 1e6)
+
+        result = {"name": name, "params": params, "runs": len(timings), "errors": errors}
+        if timings:
+            timings.sort()
+            result.update(
+                mean_us=statistics.mean(timings),
+                median_us=statistics.median(timings),
+                p99_us=timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+                min_us=timings[0],
+                max_us=timings[-1],
+            )
+        self.results.append(result)
+        print("{:<45} {} {:>12}".format(name, json.dumps(params), "{:.1f}us".format(result.get("median_us", float("nan")))), file=sys.stderr)
+
+
+def _model(size):
+    return create_model("BenchmarkModel{}".format(size), **{"FIELD_{}".format(i): (int, 0) for i in range(size)})
+
+
+def _env_file(directory, size):
+    path = os.path.join(directory, "{}.env".format(size))
+    with open(path, "w") as file_:
+        file_.write("".join("FIELD_{}={}\n".format(i, i) for i in range(size)))
+    return path
+
+
+def _ini_file(directory, size):
+    path = os.path.join(directory, "{}.ini".format(size))
+    with open(path, "w") as file_:
+        file_.write("[settings]\n" + "".join("FIELD_{}={}\n".format(i, i) for i in range(size)))
+    return path
+
+
+def _create_secret(name, size):
+    boto3.client("secretsmanager").create_secret(Name=name, SecretString=json.dumps({"FIELD_{}".format(i): str(i) for i in range(size)}))
+
+
+def _create_parameter(name, size):
+    value = json.dumps({"FIELD_{}".format(i): str(i) for i in range(size)})
+    boto3.client("ssm").put_parameter(Name=name, Value=value, Type="SecureString")
+
+
+@benchmark
+def cold_construction(runner, directory):
+    for size in MODEL_SIZES:
+        env_path, ini_path = _env_file(directory, size), _ini_file(directory, size)
+        _create_secret("cold-{}".format(size), size)
+        _create_parameter("cold-{}".format(size), size)
+
+        runner.measure("construct.CRUDRepositoryEnv", lambda: CRUDRepositoryEnv(env_path), keys=size)
+        runner.measure("construct.CRUDRepositoryIni", lambda: CRUDRepositoryIni(ini_path), keys=size)
+        runner.measure(
+            "construct.RepositoryAWSSecrets",
+            lambda: RepositoryAWSSecrets("cold-{}".format(size), client=runner.client("secretsmanager")),
+            keys=size,
+        )
+        runner.measure(
+            "construct.RepositoryAWSParameterStore",
+            lambda: RepositoryAWSParameterStore("cold-{}".format(size), client=runner.client("ssm")),
+            keys=size,
+        )
+        runner.measure("construct.ConfigByModel", lambda: ConfigByModel(CRUDRepositoryEnv(env_path), _model(size)), keys=size)
+
+
+@benchmark
+def hot_get(runner, directory):
+    for size in MODEL_SIZES:
+        repository = CRUDRepositoryEnv(_env_file(directory, size))
+        option = "FIELD_{}".format(size - 1)
+        plain = Config(repository)
+        typed = ConfigByModel(repository, _model(size))
+        snapshot = ConfigByModel(repository, _model(size), snapshot=True)
+        observed = ConfigByModel(repository, _model(size), observer=InMemoryObserver())
+
+        runner.measure("get.decouple", lambda: plain(option), repeat=runner.repeat * 10, fields=size)
+        runner.measure("get.decouple_cast_int", lambda: plain(option, cast=int), repeat=runner.repeat * 10, fields=size)
+        runner.measure("get.pydantic_cached", lambda: typed(option), repeat=runner.repeat * 10, fields=size)
+        runner.measure("get.pydantic_uncached", lambda: typed(option, use_cache=False), repeat=runner.repeat * 10, fields=size)
+        runner.measure("get.pydantic_snapshot", lambda: snapshot(option), repeat=runner.repeat * 10, fields=size)
+        runner.measure("get.pydantic_observed", lambda: observed(option), repeat=runner.repeat * 10, fields=size)
+        runner.measure(
+            "get.pydantic_first_cast",
+            lambda config: config(option),
+            setup=lambda: field_model_registry.clear() or ConfigByModel(repository, _model(size)),
+            fields=size,
+        )
+
+
+def _bulk_set_delete(repository):
+    for i in range(BULK_SIZE):
+        repository.set("BULK_{}".format(i), str(i))
+    for i in range(BULK_SIZE):
+        repository.delete("BULK_{}".format(i))
+
+
+def _bulk_batched(repository):
+    with repository.batch():
+        for i in range(BULK_SIZE):
+            repository.set("BULK_{}".format(i), str(i))
+    with repository.batch():
+        for i in range(BULK_SIZE):
+            repository.delete("BULK_{}".format(i))
+
+
+@benchmark
+def bulk_writes(runner, directory):
+    repeat = max(1, runner.repeat // 10)
+    env_path, ini_path = _env_file(directory, 10), _ini_file(directory, 10)
+    _create_secret("bulk", 10)
+    _create_parameter("bulk", 10)
+
+    runner.measure("bulk.env", _bulk_set_delete, setup=lambda: CRUDRepositoryEnv(env_path), repeat=repeat, ops=BULK_SIZE * 2)
+    runner.measure(
+        "bulk.env_log_structured",
+        _bulk_set_delete,
+        setup=lambda: CRUDRepositoryEnv(env_path, log_structured=True),
+        repeat=repeat,
+        ops=BULK_SIZE * 2,
+    )
+    runner.measure(
+        "bulk.env_safe_writes",
+        _bulk_set_delete,
+        setup=lambda: CRUDRepositoryEnv(env_path, safe_writes=True),
+        repeat=repeat,
+        ops=BULK_SIZE * 2,
+    )
+    runner.measure("bulk.ini", _bulk_set_delete, setup=lambda: CRUDRepositoryIni(ini_path), repeat=repeat, ops=BULK_SIZE * 2)
+    runner.measure(
+        "bulk.aws_secrets",
+        _bulk_set_delete,
+        setup=lambda: CRUDRepositoryAWSSecrets("bulk", client=runner.client("secretsmanager")),
+        repeat=repeat,
+        ops=BULK_SIZE * 2,
+    )
+    runner.measure(
+        "bulk.aws_secrets_batched",
+        _bulk_batched,
+        setup=lambda: CRUDRepositoryAWSSecrets("bulk", client=runner.client("secretsmanager")),
+        repeat=repeat,
+        ops=BULK_SIZE * 2,
+    )
+    runner.measure(
+        "bulk.aws_parameter_store",
+        _bulk_set_delete,
+        setup=lambda: CRUDRepositoryAWSParameterStore("bulk", client=runner.client("ssm")),
+        repeat=repeat,
+        ops=BULK_SIZE * 2,
+    )
+    runner.measure(
+        "bulk.aws_parameter_store_batched",
+        _bulk_batched,
+        setup=lambda: CRUDRepositoryAWSParameterStore("bulk", client=runner.client("ssm")),
+        repeat=repeat,
+        ops=BULK_SIZE * 2,
+    )
+
+
+@benchmark
+def refresh(runner, directory):
+    for size in MODEL_SIZES:
+        name = "refresh-{}".format(size)
+        _create_secret(name, size)
+        _create_parameter(name, size)
+        secrets = CRUDRepositoryAWSSecrets(name, client=runner.client("secretsmanager"))
+        parameters = CRUDRepositoryAWSParameterStore(name, client=runner.client("ssm"))
+
+        runner.measure("refresh.aws_secrets_unchanged", secrets.refresh, keys=size)
+        runner.measure("refresh.aws_parameter_store_unchanged", parameters.refresh, keys=size)
+        runner.measure("refresh.aws_secrets_changed", lambda _: secrets.refresh(), setup=lambda: _create_secret_version(name, size), keys=size)
+        runner.measure(
+            "refresh.aws_parameter_store_changed",
+            lambda _: parameters.refresh(),
+            setup=lambda: _create_parameter_version(name, size),
+            keys=size,
+        )
+
+
+def _create_secret_version(name, size):
+    # written through another client, so the repository has to download it again
+    values = {"FIELD_{}".format(i): str(random.random()) for i in range(size)}
+    boto3.client("secretsmanager").put_secret_value(SecretId=name, SecretString=json.dumps(values))
+
+
+def _create_parameter_version(name, size):
+    values = {"FIELD_{}".format(i): str(random.random()) for i in range(size)}
+    boto3.client("ssm").put_parameter(Name=name, Value=json.dumps(values), Type="SecureString", Overwrite=True)
+
+
+@contextmanager
+def _mocked_aws():
+    with ExitStack() as stack:
+        stack.enter_context(mock_secretsmanager())
+        stack.enter_context(mock_ssm())
+        yield
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--repeat", type=int, default=100, help="runs of each benchmark (hot gets run 10 times more)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latency added to every AWS call")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of AWS calls failing with a ThrottlingException")
+    parser.add_argument("--filter", help="only run the benchmarks whose name contains this")
+    args = parser.parse_args(argv)
+
+    runner = Runner(args.repeat, args.latency_ms / 1000, args.throttle_rate, args.filter)
+    with _mocked_aws(), tempfile.TemporaryDirectory() as directory:
+        for func in BENCHMARKS:
+            func(runner, directory)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"repeat": args.repeat, "latency_ms": args.latency_ms, "throttle_rate": args.throttle_rate},
+        "results": runner.results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file_:
+            file_.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,51 @@
-from .crud import CRUDConfig
-from .crud import CRUDConfigByModel
-from .crud import CRUDRepositoryAWSParameterStore
-from .crud import CRUDRepositoryAWSSecrets
-from .crud import CRUDRepositoryEnv
-from .crud import CRUDRepositoryIni
-from .extensions import ConfigByModel
-from .repositories import RepositoryAWSParameterStore
-from .repositories import RepositoryAWSSecrets
-
-
-__all__ = [
-    "ConfigByModel",
-    "CRUDConfig",
-    "CRUDConfigByModel",
-    "RepositoryAWSSecrets",
-    "RepositoryAWSParameterStore",
-    "CRUDRepositoryEnv",
-    "CRUDRepositoryIni",
-    "CRUDRepositoryAWSParameterStore",
-    "CRUDRepositoryAWSSecrets",
-]
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .crud import ConfigConflictError  # noqa: F401
+    from .crud import CRUDConfig  # noqa: F401
+    from .crud import CRUDRepositoryAWSParameterStore  # noqa: F401
+    from .crud import CRUDRepositoryAWSSecrets  # noqa: F401
+    from .crud import CRUDRepositoryEnv  # noqa: F401
+    from .crud import CRUDRepositoryIni  # noqa: F401
+    from .extensions import ConfigByModel  # noqa: F401
+    from .extensions import CRUDConfigByModel  # noqa: F401
+    from .repositories import RepositoryAWSParameterStore  # noqa: F401
+    from .repositories import RepositoryAWSParameterStorePath  # noqa: F401
+    from .repositories import RepositoryAWSSecrets  # noqa: F401
+    from .repositories import RepositoryAWSSecretsMulti  # noqa: F401
+    from .repositories import RepositoryChain  # noqa: F401
+
+
+# Module of each public class. They are only imported when first accessed, so using the env/ini classes
+# doesn't import pydantic, and boto3 is only imported once an AWS client is needed.
+_LAZY_ATTRIBUTES = {
+    "ConfigByModel": ".extensions",
+    "ConfigConflictError": ".crud",
+    "CRUDConfig": ".crud",
+    "CRUDConfigByModel": ".extensions",
+    "RepositoryAWSSecrets": ".repositories",
+    "RepositoryAWSSecretsMulti": ".repositories",
+    "RepositoryChain": ".repositories",
+    "RepositoryAWSParameterStore": ".repositories",
+    "RepositoryAWSParameterStorePath": ".repositories",
+    "CRUDRepositoryEnv": ".crud",
+    "CRUDRepositoryIni": ".crud",
+    "CRUDRepositoryAWSParameterStore": ".crud",
+    "CRUDRepositoryAWSSecrets": ".crud",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
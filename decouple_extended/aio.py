@@ -0,0 +1,48 @@
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+_executor_lock = threading.Lock()
+_executor = None
+# whether _executor was created here rather than given to set_executor
+_default_executor = False
+
+
+def get_executor():
+    """Executor running the blocking calls of the async API, a 4-thread pool unless set_executor was called"""
+    global _executor, _default_executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="decouple-extended-aio")
+            _default_executor = True
+        return _executor
+
+
+def set_executor(executor):
+    global _executor, _default_executor
+    with _executor_lock:
+        _executor = executor
+        _default_executor = False
+
+
+def _forget_default_executor():
+    # its threads don't exist in forked processes, a new executor is created there on first use
+    global _executor, _executor_lock
+    _executor_lock = threading.Lock()
+    if _default_executor:
+        _executor = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_default_executor)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the executor, so it doesn't stall the event loop"""
+    # imported here as it's slow to import, and already is once there's an event loop to run this
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
@@ -0,0 +1,74 @@
+import os
+import threading
+import weakref
+
+
+class ClientPool:
+    """
+    Process-wide pool of boto3 clients shared by the AWS repositories.
+
+    Clients are keyed by service, region and profile, so every repository reading from the same service
+    reuses one client and its connection pool. max_pool_connections and retries (botocore's retries
+    setting, e.g. {"max_attempts": 5, "mode": "adaptive"}) apply to the clients created afterwards.
+
+    boto3 is only imported when the first client is created, so importing this package stays cheap.
+
+    boto3 clients aren't fork-safe, so every pool is emptied in forked processes.
+    """
+
+    def __init__(self, max_pool_connections=None, retries=None):
+        self.max_pool_connections = max_pool_connections
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._clients = {}
+        _pools.add(self)
+
+    def __len__(self):
+        return len(self._clients)
+
+    def get(self, service_name, region_name=None, profile_name=None):
+        import boto3
+        from botocore.config import Config
+
+        # boto3 clients are thread-safe but sessions are not, so clients are created while holding the lock
+        with self._lock:
+            session = self._sessions.get(profile_name)
+            if session is None:
+                session = self._sessions[profile_name] = boto3.session.Session(profile_name=profile_name)
+
+            region_name = region_name or session.region_name
+            key = (service_name, region_name, profile_name)
+            client = self._clients.get(key)
+            if client is None:
+                config = None
+                if self.max_pool_connections is not None or self.retries is not None:
+                    config = Config(max_pool_connections=self.max_pool_connections or 10, retries=self.retries)
+                client = self._clients[key] = session.client(service_name, region_name=region_name, config=config)
+            return client
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._clients.clear()
+
+    def _after_fork(self):
+        # the lock may have been held by another thread of the parent
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._clients = {}
+
+
+_pools = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for pool in list(_pools):
+        pool._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+client_pool = ClientPool()
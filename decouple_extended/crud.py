@@ -1,29 +1,194 @@
+import io
 import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+from contextlib import contextmanager
+from contextlib import nullcontext
 
 from decouple import Config
 from decouple import DEFAULT_ENCODING
+from decouple import read_config
 from decouple import RepositoryEnv
 from decouple import RepositoryIni
 
-from .extensions import ConfigByModel
+from .aio import run_blocking
+from .files import atomic_write
+from .files import file_lock
+from .observers import ObservableConfigMixin
+from .repositories import ChangeListenersMixin
 from .repositories import RepositoryAWSParameterStore
 from .repositories import RepositoryAWSSecrets
 
 
-class CRUDConfig(Config):
+logger = logging.getLogger(__name__)
+
+# Marks a pending deletion in CRUDBaseAWSRepositoryMixin
+_DELETED = object()
+# Returned by _previous_version when it can't be told anymore
+_UNKNOWN = object()
+
+# Starts the lines deleting a key from a log-structured .env file
+_TOMBSTONE_PREFIX = "unset "
+_TOMBSTONE_PREFIX_LENGTH = len(_TOMBSTONE_PREFIX)
+
+
+def __getattr__(name):
+    # CRUDConfigByModel lives with ConfigByModel, so that using the other classes doesn't import pydantic
+    if name == "CRUDConfigByModel":
+        from .extensions import CRUDConfigByModel
+
+        return CRUDConfigByModel
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+class ConfigConflictError(Exception):
+    """Raised when other processes keep writing the same config while we try to save it"""
+
+
+_executor_lock = threading.Lock()
+_executor = None
+
+
+def _default_executor():
+    # a single worker keeps the notifications of every config in order
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decouple-extended-subscriptions")
+        return _executor
+
+
+def _forget_default_executor():
+    # its thread doesn't exist in forked processes, a new executor is created there on first use
+    global _executor, _executor_lock
+    _executor_lock = threading.Lock()
+    _executor = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_default_executor)
+
+
+class CRUDConfig(Config, ObservableConfigMixin):
     """
     CRUD Extension of python-decouple's Config class.
 
     Works the same as its parent method, but allows you to set, update, and delete keys.
+    Given an observer (see decouple_extended.observers), every get is timed and reported to it.
     """
 
+    def __init__(self, repository, observer=None):
+        super().__init__(repository)
+        self.observer = observer
+
     def __iter__(self):
         return self.repository.__iter__()
 
+    def _key_changed(self, key):
+        """Hook called when a key changes. Subclasses keeping derived state should override it."""
+
+    def _written(self, key):
+        # repositories with listeners already report their own writes
+        if not hasattr(self.repository, "add_listener"):
+            self._key_changed(key)
+            self._dispatch_change(key)
+
+    def subscribe(self, keys, callback, executor=None):
+        """
+        Call callback(key, old_value, new_value) whenever the value of one of keys changes.
+
+        Changes are detected on set, update and delete, and on repository reloads when the repository
+        reports them. Values are the ones get() returns (None for missing keys), and callbacks run on the
+        given executor, a shared single-thread one by default. Returns a function that unsubscribes.
+        """
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        subscription = (frozenset(keys), callback, executor or _default_executor())
+
+        state = self._subscription_state()
+        with state["lock"]:
+            for key in keys:
+                if key not in state["values"]:
+                    state["values"][key] = self._subscribed_value(key)
+            state["subscriptions"].append(subscription)
+            if not state["listening"] and hasattr(self.repository, "add_listener"):
+                self.repository.add_listener(self._dispatch_change)
+                state["listening"] = True
+
+        def unsubscribe():
+            with state["lock"]:
+                if subscription in state["subscriptions"]:
+                    state["subscriptions"].remove(subscription)
+
+        return unsubscribe
+
+    # Async counterparts, running the blocking calls to the repository on the executor of decouple_extended.aio
+    async def aget(self, *args, **kwargs):
+        return await run_blocking(self.get, *args, **kwargs)
+
+    async def aset(self, key, value):
+        await run_blocking(self.set, key, value)
+
+    async def aupdate(self, key, new_value):
+        await run_blocking(self.update, key, new_value)
+
+    async def adelete(self, key):
+        await run_blocking(self.delete, key)
+
+    async def arefresh(self):
+        """Reload the repository from its source, if it can be"""
+        if hasattr(self.repository, "refresh"):
+            await run_blocking(self.repository.refresh)
+        elif hasattr(self.repository, "check_for_changes"):
+            await run_blocking(self.repository.check_for_changes)
+
+    def _subscription_state(self):
+        # created lazily as CRUDConfigByModel doesn't go through Config.__init__
+        return self.__dict__.setdefault("_subscriptions", {"lock": threading.RLock(), "values": {}, "subscriptions": [], "listening": False})
+
+    def _subscribed_value(self, key):
+        return self.get(key, default=None)
+
+    def _dispatch_change(self, key):
+        state = self.__dict__.get("_subscriptions")
+        if state is None:
+            return
+
+        with state["lock"]:
+            # some repositories (e.g. ini files) don't tell keys apart by case
+            for watched_key in [watched_key for watched_key in state["values"] if watched_key.lower() == key.lower()]:
+                try:
+                    new_value = self._subscribed_value(watched_key)
+                except Exception:
+                    logger.exception("Could not read %s to notify its subscribers", watched_key)
+                    continue
+
+                old_value = state["values"][watched_key]
+                if new_value == old_value:
+                    continue
+                state["values"][watched_key] = new_value
+                for keys, callback, executor in state["subscriptions"]:
+                    if watched_key in keys:
+                        executor.submit(_run_subscriber, callback, watched_key, old_value, new_value)
+
+    def batch(self):
+        """
+        Group writes made inside a `with config.batch():` block.
+
+        Repositories that support it save them once, when the block exits, and roll them back if the block or
+        the save fails. Other repositories just save each write as usual.
+        """
+        batch = getattr(self.repository, "batch", None)
+        return batch() if batch is not None else nullcontext(self.repository)
+
     # CREATE method
     def set(self, key, value):
         if key not in self.repository:
             self.repository.set(key, value)
+            self._written(key)
         else:
             raise ValueError("Error: Key already exists in the config")
 
@@ -35,6 +200,7 @@ class CRUDConfig(Config):
     def update(self, key, new_value):
         if key in self.repository:
             self.repository.set(key, new_value)
+            self._written(key)
         else:
             raise KeyError("Error: There is no such key")
 
@@ -42,15 +208,19 @@ class CRUDConfig(Config):
     def delete(self, key):
         if key in self.repository:
             del self.repository[key]
+            self._written(key)
         else:
             raise KeyError("Error: There is no such key")
 
 
-class CRUDConfigByModel(ConfigByModel, CRUDConfig):
-    """Works the same as CRUDConfig but casts the values to the model."""
+def _run_subscriber(callback, key, old_value, new_value):
+    try:
+        callback(key, old_value, new_value)
+    except Exception:
+        logger.exception("Subscriber of %s failed", key)
 
 
-class CRUDBaseRepositoryMixin:
+class CRUDBaseRepositoryMixin(ChangeListenersMixin):
     def list(self):
         return list(self.data.keys())
 
@@ -61,17 +231,128 @@ class CRUDBaseRepositoryMixin:
         return self.delete(__name)
 
 
-class CRUDRepositoryEnv(RepositoryEnv, CRUDBaseRepositoryMixin):
+class CRUDBaseFileRepositoryMixin:
+    """
+    Writes of the file-based repositories.
+
+    With safe_writes=True, every change holds an advisory lock on the file (through a companion .lock file),
+    reloads the changes other processes made to it first, and fsyncs what it writes. Rewrites go to a
+    temporary file renamed over the original, so the file is never seen half written.
+
+    With a watch_interval (in seconds), reads check at most once per interval whether the file changed on
+    disk (by its modification time, size and inode) and reload it if so. Callbacks registered with
+    add_reload_listener are then called with the lists of added, removed and modified keys. While the file
+    can't be read (e.g. it was removed), the values last loaded from it are kept.
+    """
+
+    safe_writes = False
+    watch_interval = None
+    _watch_deadline = 0.0
+    _file_signature = None
+
+    def add_reload_listener(self, callback):
+        self.__dict__.setdefault("_reload_listeners", []).append(callback)
+
+    def check_for_changes(self):
+        """Reload the file if it changed since it was last read or written. Returns whether it was reloaded."""
+        signature = _file_signature(self.source)
+        if signature == self._file_signature:
+            return False
+        self._file_signature = signature
+        try:
+            self._reload()
+        except OSError:
+            # e.g. removed, or briefly missing while it's replaced: retried once the file changes again
+            logger.exception("Could not reload %s, keeping the values last loaded from it", self.source)
+            return False
+        return True
+
+    def _watch(self):
+        now = time.monotonic()
+        if now >= self._watch_deadline:
+            self._watch_deadline = now + self.watch_interval
+            self.check_for_changes()
+
+    def _reloaded(self, changes):
+        if any(changes):
+            for callback in list(self.__dict__.get("_reload_listeners", ())):
+                callback(*changes)
+
+    def _written(self):
+        # Our own writes don't need a reload. They're always based on the file as it was right before them
+        # (see _reload_before_write), so its new signature doesn't hide changes made by other processes.
+        if self.watch_interval:
+            self._file_signature = _file_signature(self.source)
+
+    def _locked(self):
+        return file_lock(self.source) if self.safe_writes else nullcontext()
+
+    def _reload_before_write(self):
+        if self.safe_writes:
+            self._reload()
+        elif self.watch_interval:
+            self.check_for_changes()
+
+    def _append(self, text):
+        with open(self.source, "a", encoding=self.encoding) as file_:
+            file_.write(text)
+            if self.safe_writes:
+                file_.flush()
+                os.fsync(file_.fileno())
+        self._written()
+
+    def _rewrite(self, text):
+        if self.safe_writes:
+            atomic_write(self.source, text.encode(self.encoding))
+        else:
+            with open(self.source, "w", encoding=self.encoding) as file_:
+                file_.write(text)
+        self._written()
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class CRUDRepositoryEnv(RepositoryEnv, CRUDBaseFileRepositoryMixin, CRUDBaseRepositoryMixin):
     """
     CRUD extension of python-decouple's RepositoryEnv class.
 
     Works the same as its parent method, but allows you to set, update, and delete keys.
+
+    With log_structured=True the file is only ever appended to: updates add a new line that wins over the
+    previous ones, and deletions add an `unset KEY` line (which shells understand too). compact() rewrites
+    the file with only the live lines, keeping comments and the order of the untouched ones, and is run
+    automatically once compact_threshold lines are dead.
     """
 
-    def __init__(self, source, encoding=DEFAULT_ENCODING):
+    def __init__(self, source, encoding=DEFAULT_ENCODING, log_structured=False, compact_threshold=None, safe_writes=False, watch_interval=None):
         self.source = source
         self.encoding = encoding
-        super().__init__(source, encoding)
+        self.safe_writes = safe_writes
+        self.watch_interval = watch_interval
+        if watch_interval:
+            self._file_signature = _file_signature(source)
+        self.log_structured = log_structured
+        self.compact_threshold = compact_threshold
+        # parsed like _reload does, rather than by RepositoryEnv, so that both agree on `unset KEY` lines
+        with open(source, encoding=encoding) as file_:
+            self.data, dead_lines = _parse_env_lines(file_)
+        self.dead_lines = dead_lines if log_structured else 0
+
+    def __contains__(self, key):
+        if self.watch_interval:
+            self._watch()
+        return super().__contains__(key)
+
+    def __getitem__(self, key):
+        if self.watch_interval:
+            self._watch()
+        return super().__getitem__(key)
 
     def set(self, key, value):
         if not isinstance(value, str):
@@ -80,31 +361,140 @@ class CRUDRepositoryEnv(RepositoryEnv, CRUDBaseRepositoryMixin):
             except TypeError:
                 raise TypeError("Error: Value must be a string or a JSON serializable object")
 
-        self.data[key] = value
-        with open(self.source, "a", encoding=self.encoding) as file_:
-            file_.write(f"{key}={value}\n")
+        with self._locked():
+            self._reload_before_write()
+            if self.log_structured and key in self.data:
+                self.dead_lines += 1
+            self.data[key] = value
+            self._append(f"{key}={value}\n")
+        self._notify(key)
+        self._compact_if_needed()
 
     def delete(self, key):
-        if key in self.data:
+        with self._locked():
+            self._reload_before_write()
+            if key not in self.data:
+                return
             del self.data[key]
-            # This will rewrite the entire file without the deleted key
-            with open(self.source, "w", encoding=self.encoding) as file_:
-                for k, v in self.data.items():
-                    file_.write(f"{k}={v}\n")
-
-
-class CRUDRepositoryIni(RepositoryIni, CRUDBaseRepositoryMixin):
+            if self.log_structured:
+                # the key's line and the tombstone are both dead
+                self._append(f"{_TOMBSTONE_PREFIX}{key}\n")
+                self.dead_lines += 2
+            else:
+                # This will rewrite the entire file without the deleted key
+                self._rewrite("".join(f"{k}={v}\n" for k, v in self.data.items()))
+        self._notify(key)
+        self._compact_if_needed()
+
+    def _reload(self):
+        with open(self.source, encoding=self.encoding) as file_:
+            data, dead_lines = _parse_env_lines(file_)
+        previous_data, self.data = self.data, data
+        if self.log_structured:
+            self.dead_lines = dead_lines
+        self._reloaded(self._notify_changes(previous_data, data))
+
+    def compact(self):
+        """Atomically rewrite the file without overridden, deleted and tombstone lines"""
+        with self._locked():
+            self._reload_before_write()
+            self._compact()
+
+    def _compact(self):
+        with open(self.source, encoding=self.encoding) as file_:
+            lines = file_.readlines()
+
+        last_lines = {}
+        for index, line in enumerate(lines):
+            key = _env_line_key(line)
+            if key is not None:
+                last_lines[key] = index
+
+        live_lines = []
+        for index, line in enumerate(lines):
+            key = _env_line_key(line)
+            if key is None:
+                live_lines.append(line)
+            elif last_lines[key] == index and key in self.data and _unset_key(line) is None:
+                live_lines.append(line if line.endswith("\n") else line + "\n")
+
+        atomic_write(self.source, "".join(live_lines).encode(self.encoding))
+        self.dead_lines = 0
+        self._written()
+
+    def _compact_if_needed(self):
+        if self.log_structured and self.compact_threshold is not None and self.dead_lines >= self.compact_threshold:
+            self.compact()
+
+
+def _unset_key(line):
+    """Return the key deleted by a .env tombstone line, or None if line isn't one"""
+    line = line.strip()
+    if not line.startswith(_TOMBSTONE_PREFIX):
+        return None
+    return line[_TOMBSTONE_PREFIX_LENGTH:].strip()
+
+
+def _env_line_key(line):
+    """Return the key set or unset by a .env line, or None for comments, blank and unparsable lines"""
+    unset_key = _unset_key(line)
+    if unset_key is not None:
+        return unset_key
+    line = line.strip()
+    if not line or line.startswith("#") or "=" not in line:
+        return None
+    return line.split("=", 1)[0].strip()
+
+
+def _parse_env_lines(lines):
+    """Parse .env lines like python-decouple does, also applying `unset KEY` lines. Returns the data and the count of dead lines."""
+    data = {}
+    records = 0
+    for line in lines:
+        unset_key = _unset_key(line)
+        if unset_key is not None:
+            data.pop(unset_key, None)
+            records += 1
+            continue
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        k, v = line.split("=", 1)
+        k = k.strip()
+        v = v.strip()
+        if len(v) >= 2 and ((v[0] == "'" and v[-1] == "'") or (v[0] == '"' and v[-1] == '"')):
+            v = v[1:-1]
+        data[k] = v
+        records += 1
+    return data, records - len(data)
+
+
+class CRUDRepositoryIni(RepositoryIni, CRUDBaseFileRepositoryMixin, CRUDBaseRepositoryMixin):
     """
     CRUD extension of python-decouple's RepositoryIni class.
 
     Works the same as its parent method, but allows you to set, update, and delete keys.
     """
 
-    def __init__(self, source, encoding=DEFAULT_ENCODING):
+    def __init__(self, source, encoding=DEFAULT_ENCODING, safe_writes=False, watch_interval=None):
         self.source = source
         self.encoding = encoding
+        self.safe_writes = safe_writes
+        self.watch_interval = watch_interval
+        if watch_interval:
+            self._file_signature = _file_signature(source)
         super().__init__(source, encoding)
 
+    def __contains__(self, key):
+        if self.watch_interval:
+            self._watch()
+        return super().__contains__(key)
+
+    def __getitem__(self, key):
+        if self.watch_interval:
+            self._watch()
+        return super().__getitem__(key)
+
     def list(self):
         if self.parser.has_section(self.SECTION):
             return self.parser.options(self.SECTION)
@@ -118,18 +508,57 @@ class CRUDRepositoryIni(RepositoryIni, CRUDBaseRepositoryMixin):
             except TypeError:
                 raise TypeError("Error: Value must be a string or a JSON serializable object")
 
-        self.parser.set(self.SECTION, key, value)
-        with open(self.source, "w", encoding=self.encoding) as file_:
-            self.parser.write(file_)
+        with self._locked():
+            self._reload_before_write()
+            self.parser.set(self.SECTION, key, value)
+            self._write_parser()
+        self._notify(key)
 
     def delete(self, key):
-        if self.parser.has_option(self.SECTION, key):
+        with self._locked():
+            self._reload_before_write()
+            if not self.parser.has_option(self.SECTION, key):
+                return
             self.parser.remove_option(self.SECTION, key)
-            with open(self.source, "w", encoding=self.encoding) as file_:
-                self.parser.write(file_)
+            self._write_parser()
+        self._notify(key)
+
+    def _write_parser(self):
+        text = io.StringIO()
+        self.parser.write(text)
+        self._rewrite(text.getvalue())
+
+    def _reload(self):
+        parser = ConfigParser()
+        with open(self.source, encoding=self.encoding) as file_:
+            read_config(parser, file_)
+        previous_parser, self.parser = self.parser, parser
+        self._reloaded(self._notify_changes(_ini_section(previous_parser, self.SECTION), _ini_section(parser, self.SECTION)))
+
+
+def _ini_section(parser, section):
+    if not parser.has_section(section):
+        return {}
+    return {key: parser.get(section, key, raw=True) for key in parser.options(section)}
 
 
 class CRUDBaseAWSRepositoryMixin:
+    """
+    Writes the whole object back to AWS whenever a key is set or deleted.
+
+    Writes are optimistic: the version stored in AWS is compared with the loaded one before saving, and if
+    another process saved in between, its data is fetched and the changes made here since the last save are
+    replayed on top of it. As AWS has no conditional writes, the write is then checked to directly follow the
+    version it was based on (for secrets, only while it's still the current version). Up to max_write_retries
+    conflicts are resolved this way, counted in `conflicts`, before giving up with ConfigConflictError.
+    """
+
+    max_write_retries = 3
+    conflicts = 0
+
+    # keys changed inside the current batch, None when not batching
+    _batch_changes = None
+
     def set(self, key, value):
         # Check value
         if not isinstance(value, str):
@@ -138,16 +567,122 @@ class CRUDBaseAWSRepositoryMixin:
             except TypeError:
                 raise TypeError("Error: Value must be a string or a JSON serializable object")
 
-        self.data[key] = value
-        self._save_data()
+        with self._data_lock:
+            self._thaw_data()
+            self.data[key] = value
+            self._pending_changes()[key] = value
+            self._changed(key)
 
     def delete(self, key):
-        if key in self.data:
-            del self.data[key]
-            self._save_data()
-
-
-class CRUDRepositoryAWSSecrets(RepositoryAWSSecrets, CRUDBaseAWSRepositoryMixin, CRUDBaseRepositoryMixin):
+        with self._data_lock:
+            if key in self.data:
+                self._thaw_data()
+                del self.data[key]
+                self._pending_changes()[key] = _DELETED
+                self._changed(key)
+
+    def _observed_save_data(self):
+        start = time.perf_counter()
+        error = None
+        try:
+            return type(self)._save_data(self)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            self.observer.on_remote_call(self, "save", time.perf_counter() - start, len(json.dumps(dict(self.data))), error)
+
+    def _thaw_data(self):
+        # preloaded data is read-only, see BaseAWSRepository
+        if not isinstance(self.data, dict):
+            self.data = dict(self.data)
+
+    def _pending_changes(self):
+        # changes made since the last save, replayed over the data of other writers on conflicts
+        return self.__dict__.setdefault("_pending", {})
+
+    def _loaded(self):
+        # a refresh replaced `data` with the stored version, which doesn't have the changes not saved yet
+        super()._loaded()
+        pending = self._pending_changes()
+        if pending:
+            self.data = _apply_changes(dict(self.data), pending)
+
+    def _changed(self, key):
+        if self._batch_changes is not None:
+            self._batch_changes.add(key)
+        else:
+            self._save()
+        self._notify(key)
+
+    def _save(self):
+        with self._data_lock:
+            base_version = self.version
+            for _ in range(self.max_write_retries + 1):
+                current_version = self._fetch_remote_version()
+                if current_version != base_version:
+                    self._merge_remote(current_version)
+                    self.version = base_version = current_version
+
+                self._save_data()
+                previous_version = self._previous_version(self.version)
+                if previous_version is _UNKNOWN or previous_version == base_version:
+                    self._pending_changes().clear()
+                    self._write_cache()
+                    return
+
+                # Another writer saved between our check and our write, so its changes were just overwritten
+                self._merge_remote(previous_version)
+                base_version = self.version
+
+        raise ConfigConflictError("Error: Could not save the config after {} conflicting writes".format(self.max_write_retries + 1))
+
+    def _merge_remote(self, version):
+        self.conflicts += 1
+        logger.warning("%s was changed by another writer, merging version %s", type(self).__name__, version)
+
+        data = _apply_changes(self._fetch_data(version), self._pending_changes())
+        previous_data, self.data = self.data, data
+        self._notify_changes(previous_data, data)
+
+    @contextmanager
+    def batch(self):
+        """
+        Save the writes made inside the block with a single call to AWS, when it exits.
+
+        If the block raises or the save fails, the keys written in the block are rolled back to what they
+        were before it. Nested batches are part of the outermost one. The block holds the repository's lock,
+        so writes and refreshes from other threads wait for it to exit instead of joining the batch.
+        """
+        with self._data_lock:
+            if self._batch_changes is not None:
+                yield self
+                return
+
+            previous_data = dict(self.data)
+            previous_pending = dict(self._pending_changes())
+            self._batch_changes = changes = set()
+            try:
+                yield self
+                if changes:
+                    self._save()
+            except BaseException:
+                # only the keys of the batch, as a refresh may have loaded changes of other writers meanwhile
+                self._thaw_data()
+                for key in changes:
+                    if key in previous_data:
+                        self.data[key] = previous_data[key]
+                    else:
+                        self.data.pop(key, None)
+                self._pending = previous_pending
+                for key in changes:
+                    self._notify(key)
+                raise
+            finally:
+                self._batch_changes = None
+
+
+class CRUDRepositoryAWSSecrets(CRUDBaseAWSRepositoryMixin, RepositoryAWSSecrets, CRUDBaseRepositoryMixin):
     """
     CRUD extension of our own RepositoryAWSSecrets class.
 
@@ -155,10 +690,28 @@ class CRUDRepositoryAWSSecrets(RepositoryAWSSecrets, CRUDBaseAWSRepositoryMixin,
     """
 
     def _save_data(self):
-        self.client.put_secret_value(SecretId=self.secret_name, SecretString=json.dumps(self.data))
+        response = self.client.put_secret_value(SecretId=self.secret_name, SecretString=json.dumps(self.data))
+        self.version = response.get("VersionId")
+
+    def _version_stages(self):
+        return self.client.describe_secret(SecretId=self.secret_name).get("VersionIdsToStages", {})
+
+    def _fetch_remote_version(self):
+        return _version_with_stage(self._version_stages(), "AWSCURRENT")
+
+    def _previous_version(self, version):
+        stages = self._version_stages()
+        if _version_with_stage(stages, "AWSCURRENT") != version:
+            # A later writer already saved over ours, so the stages don't tell what preceded it anymore
+            return _UNKNOWN
+        return _version_with_stage(stages, "AWSPREVIOUS")
+
+    def _fetch_data(self, version):
+        response = self.client.get_secret_value(SecretId=self.secret_name, VersionId=version)
+        return json.loads(response["SecretString"]) if "SecretString" in response else {}
 
 
-class CRUDRepositoryAWSParameterStore(RepositoryAWSParameterStore, CRUDBaseAWSRepositoryMixin, CRUDBaseRepositoryMixin):
+class CRUDRepositoryAWSParameterStore(CRUDBaseAWSRepositoryMixin, RepositoryAWSParameterStore, CRUDBaseRepositoryMixin):
     """
     CRUD extension of our own RepositoryAWSParameterStore class.
 
@@ -166,4 +719,32 @@ class CRUDRepositoryAWSParameterStore(RepositoryAWSParameterStore, CRUDBaseAWSRe
     """
 
     def _save_data(self):
-        self.client.put_parameter(Name=self.parameter_store_name, Value=json.dumps(self.data), Type="SecureString", Overwrite=True)
+        response = self.client.put_parameter(Name=self.parameter_store_name, Value=json.dumps(self.data), Type="SecureString", Overwrite=True)
+        self.version = response.get("Version")
+
+    def _fetch_remote_version(self):
+        return self.client.get_parameter(Name=self.parameter_store_name).get("Parameter", {}).get("Version")
+
+    def _previous_version(self, version):
+        # parameter versions are consecutive numbers
+        return version - 1 if version and version > 1 else None
+
+    def _fetch_data(self, version):
+        response = self.client.get_parameter(Name="{}:{}".format(self.parameter_store_name, version), WithDecryption=True)
+        return json.loads(response["Parameter"]["Value"])
+
+
+def _apply_changes(data, changes):
+    for key, value in changes.items():
+        if value is _DELETED:
+            data.pop(key, None)
+        else:
+            data[key] = value
+    return data
+
+
+def _version_with_stage(stages, stage):
+    for version, version_stages in stages.items():
+        if stage in version_stages:
+            return version
+    return None
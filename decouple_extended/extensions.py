@@ -1,16 +1,83 @@
+import json
+import logging
 import os
-from typing import Dict
+import threading
+import time
+import types
+from collections import namedtuple
+from collections import OrderedDict
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import get_args
+from typing import get_origin
+from typing import Optional
 from typing import Type
+from typing import Union
 
 from decouple import Undefined
 from decouple import undefined
 from decouple import UndefinedValueError
 from pydantic import BaseModel
+from pydantic import ConfigDict
 from pydantic import create_model
+from pydantic import TypeAdapter
+from pydantic import ValidationError
 
+from .crud import CRUDConfig
+from .observers import ObservableConfigMixin
 
-# Temporary fix until pydantic 2.4.3 due to issue https://github.com/pydantic/pydantic/issues/7720
-import json
+
+logger = logging.getLogger(__name__)
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "currsize"])
+
+
+def _loads_json_object(value):
+    # Temporary fix until pydantic 2.4.3 due to issue https://github.com/pydantic/pydantic/issues/7720
+    try:
+        return json.loads(value) if value.startswith("{") and value.endswith("}") else value
+    except Exception:
+        # any exception means value doesn't seems to be a json string
+        return value
+
+
+# Field types cast without a single-field model, see simple_type_adapter
+SIMPLE_TYPES = (int, bool, str, float)
+# Optional[X] and X | None (python 3.10+)
+_UNION_TYPES = (Union, getattr(types, "UnionType", Union))
+
+
+@lru_cache(maxsize=None)
+def _type_adapter(annotation):
+    return TypeAdapter(annotation)
+
+
+def simple_type_adapter(field) -> Optional[TypeAdapter]:
+    """
+    Return a TypeAdapter validating values the way a single-field model of field would, if its type is one
+    of SIMPLE_TYPES or an Optional of one, without constraints. Return None for any other field.
+    """
+    if field.metadata:
+        return None
+    annotation = field.annotation
+    if annotation not in SIMPLE_TYPES:
+        args = get_args(annotation)
+        if get_origin(annotation) not in _UNION_TYPES or len(args) != 2 or type(None) not in args:
+            return None
+        if not any(arg in SIMPLE_TYPES for arg in args):
+            return None
+    return _type_adapter(annotation)
+
+
+class ConfigValuesError(UndefinedValueError):
+    """Reports every missing option and invalid value found by ConfigByModel.get_many at once"""
+
+    def __init__(self, missing, errors):
+        self.missing = missing
+        self.errors = errors
+        messages = ["{} not found. Declare it as envvar or define a default value.".format(option) for option in missing]
+        messages += ["{}: {}".format(".".join(str(part) for part in error["loc"]), error["msg"]) for error in errors]
+        super().__init__("\n".join(messages))
 
 
 class ConfigBaseModel(BaseModel):
@@ -21,49 +88,248 @@ class ConfigBaseModel(BaseModel):
         return create_model("ConfigSingleFieldModel", __base__=cls, **field_definitions)
 
 
-class ConfigByModel(object):
+class FieldModelRegistry:
+    """
+    Process-wide cache of the single-field models created for each model class.
+
+    Keeps the fields of at most maxsize model classes, dropping the least recently used one beyond that.
+    The models made of several fields (see get_many) are bounded the same way, by maxsize sets of fields.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._models_by_class = OrderedDict()
+        self._models_by_fields = OrderedDict()
+
+    def __len__(self):
+        return len(self._models_by_class)
+
+    def get(self, model: Type[BaseModel], field_name: str) -> Type[BaseModel]:
+        with self._lock:
+            field_models = self._models_by_class.get(model)
+            if field_models is None:
+                field_models = self._models_by_class[model] = {}
+                if len(self._models_by_class) > self.maxsize:
+                    self._models_by_class.popitem(last=False)
+            else:
+                self._models_by_class.move_to_end(model)
+
+            if field_name not in field_models:
+                # Dynamically create a Pydantic model for the individual field
+                field = model.model_fields[field_name]
+                field_models[field_name] = ConfigBaseModel.with_fields(**{field_name: (field.annotation, field.default)})
+            return field_models[field_name]
+
+    def get_many(self, model: Type[BaseModel], field_names) -> Type[BaseModel]:
+        """Return a model with only the given fields of model, as the single-field models have them"""
+        key = (model, frozenset(field_names))
+        with self._lock:
+            fields_model = self._models_by_fields.get(key)
+            if fields_model is not None:
+                self._models_by_fields.move_to_end(key)
+                return fields_model
+
+            definitions = {name: (model.model_fields[name].annotation, model.model_fields[name].default) for name in field_names}
+            fields_model = self._models_by_fields[key] = create_model("ConfigFieldsModel", __base__=ConfigBaseModel, **definitions)
+            if len(self._models_by_fields) > self.maxsize:
+                self._models_by_fields.popitem(last=False)
+            return fields_model
+
+    def clear(self):
+        with self._lock:
+            self._models_by_class.clear()
+            self._models_by_fields.clear()
+
+
+field_model_registry = FieldModelRegistry()
+
+
+class FieldModels(Mapping):
+    """
+    Maps the field names of a model to their single-field models.
+
+    Each single-field model is only created the first time its field is requested, and is shared with
+    every other FieldModels of the same model class through the registry.
+
+    Fields of a simple type (see simple_type_adapter) are also mapped in `adapters` to a TypeAdapter, which
+    casts their values much faster than a model does.
+    """
+
+    def __init__(self, model: Type[BaseModel] = None, registry: FieldModelRegistry = field_model_registry):
+        self.model = model
+        self.fields = model.model_fields if model is not None else {}
+        self.registry = registry
+        self._models = {}
+        self.adapters = {}
+        for field_name, field in self.fields.items():
+            adapter = simple_type_adapter(field)
+            if adapter is not None:
+                self.adapters[field_name] = adapter
+
+    def __contains__(self, field_name):
+        return field_name in self.fields
+
+    def __getitem__(self, field_name):
+        try:
+            return self._models[field_name]
+        except KeyError:
+            if field_name not in self.fields:
+                raise
+
+        field_model = self._models[field_name] = self.registry.get(self.model, field_name)
+        return field_model
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+
+class ConfigByModel(ObservableConfigMixin):
     """
     Extension of python-decouple's Config class, to do casting using pydantic models
+
+    With snapshot=True the whole model is validated once, against os.environ and the repository, and
+    get() is served from the resulting frozen instance (available as `settings`). Missing or invalid
+    fields are then reported at construction time instead of on first access. Call refresh() to take
+    a new snapshot. A new snapshot is also taken whenever a field changes in the repository; if the
+    change makes the model invalid, it's logged and get() casts each field on its own (raising for the
+    invalid ones) until a later change makes it valid again.
+
+    With snapshot_env=True the environment variables named after model fields are copied once, and read
+    from that copy instead of os.environ, which is slower to query. Call refresh_env() to copy them again.
+
+    Given an observer (see decouple_extended.observers), every get and cast is timed and reported to it.
     """
 
-    def __init__(self, repository, model: BaseModel = None):
+    observed_methods = ("get", "_cast")
+
+    def __init__(self, repository, model: BaseModel = None, snapshot=False, snapshot_env=False, observer=None):
         self.repository = repository
+        self.observer = observer
         self.model = model
         self.models_by_field = self.create_field_models(model)
+        self.settings = None
+        self._snapshot = False
+
+        self._snapshot_env = snapshot_env
+        self._environ = os.environ
+        self._environ_fields = frozenset()
+        if snapshot_env:
+            self._environ_fields = frozenset(self.models_by_field)
+            self.refresh_env()
+
+        # (raw value, typed value) by option, replaced when the raw value changes and dropped when the option does
+        self._cast_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        if hasattr(repository, "add_listener"):
+            repository.add_listener(self._key_changed)
+
+        self._settings_model = None
+        self._snapshot_raw = {}
+        if snapshot:
+            self._snapshot = True
+            self.refresh()
 
-    def create_field_models(self, model: Type[BaseModel]) -> Dict[str, Type[BaseModel]]:
-        field_models = {}
+    def refresh(self) -> BaseModel:
+        """Validate the whole model in one go against os.environ and the repository, and keep the result"""
+        raw = {}
+        for field_name in self.models_by_field:
+            if field_name in self._environ:
+                raw[field_name] = self._environ[field_name]
+            elif field_name in self.repository:
+                raw[field_name] = self.repository[field_name]
 
-        for field_name, field in model.model_fields.items():
-            # Dynamically create a Pydantic model for the individual field
-            attributes = {field_name: (field.annotation, field.default)}
-            field_model = ConfigBaseModel.with_fields(**attributes)
-            field_models[field_name] = field_model
+        if self._settings_model is None:
+            self._settings_model = self.model
+            if not self.model.model_config.get("frozen"):
+                self._settings_model = type(
+                    self.model.__name__,
+                    (self.model,),
+                    {"__module__": self.model.__module__, "model_config": ConfigDict({**self.model.model_config, "frozen": True})},
+                )
 
-        return field_models
+        self.settings = self._settings_model.model_validate({name: _loads_json_object(value) for name, value in raw.items()})
+        self._snapshot_raw = raw
+        self.invalidate_cache()
+        return self.settings
+
+    def refresh_env(self):
+        """Copy again the environment variables named after model fields (see snapshot_env), if they're copied"""
+        if not self._snapshot_env:
+            # os.environ is read directly
+            return
+        self._environ = {name: os.environ[name] for name in self._environ_fields if name in os.environ}
+        if self._snapshot:
+            self.refresh()
+
+    def cache_info(self) -> CacheInfo:
+        """Report how many casts were served from the cache and how many had to be computed"""
+        return CacheInfo(self.cache_hits, self.cache_misses, len(self._cast_cache))
+
+    def invalidate_cache(self, option=None):
+        """Forget the cached typed values of option, or of every option if none is given"""
+        if option is None:
+            self._cast_cache.clear()
+        else:
+            self._cast_cache.pop(option, None)
+
+    def _key_changed(self, key):
+        if not self._snapshot or key not in self.models_by_field:
+            self.invalidate_cache(key)
+            return
+
+        try:
+            self.refresh()
+        except ValidationError:
+            logger.exception("Could not take a new snapshot after %s changed, casting each field on its own", key)
+            self.settings = None
+            self._snapshot_raw = {}
+            self.invalidate_cache()
+
+    def create_field_models(self, model: Type[BaseModel]) -> FieldModels:
+        return FieldModels(model)
 
     def _cast_with_pydantic(self, option, value):
-        if self.model is None:
+        if self.model is None or option not in self.models_by_field:
             return value
-        
-        # Temporary fix until pydantic 2.4.3 due to issue https://github.com/pydantic/pydantic/issues/7720
-        try:
-            value = json.loads(value) if value.startswith('{') and value.endswith('}') else value
-        except Exception:
-            # any exception means value doesn't seems to be a json string
-            pass
+
+        value = _loads_json_object(value)
+        adapter = self.models_by_field.adapters.get(option)
+        if adapter is not None:
+            try:
+                return adapter.validate_python(value)
+            except ValidationError:
+                # validated again below, so the error raised is the one of the single-field model
+                pass
 
         parsed_data = self.models_by_field[option].model_validate({option: value})
         return getattr(parsed_data, option)
 
-    def get(self, option, default=undefined, cast=undefined):
+    def get(self, option, default=undefined, cast=undefined, use_cache=True):
         """
         Return the value for option or default if defined.
+
+        Values cast by the model are cached, one per option, and shared between calls, so mutable values
+        (dicts, lists) must not be modified in place. Pass use_cache=False to always cast again. Values
+        cast by an explicit cast are never cached.
         """
 
+        if self.settings is not None and isinstance(cast, Undefined) and option in self.models_by_field:
+            # an explicit default still wins over the model's one when the option is in no source
+            if option in self._snapshot_raw or isinstance(default, Undefined) or not default:
+                return getattr(self.settings, option)
+
+        environ = self._environ if option in self._environ_fields else os.environ
+
         # We can't avoid __contains__ because value may be empty.
-        if option in os.environ:
-            value = os.environ[option]
+        if option in self._snapshot_raw:
+            value = self._snapshot_raw[option]
+        elif option in environ:
+            value = environ[option]
         elif option in self.repository:
             value = self.repository[option]
         elif option in self.models_by_field:
@@ -78,6 +344,22 @@ class ConfigByModel(object):
                 raise UndefinedValueError("{} not found. Declare it as envvar or define a default value.".format(option))
             value = default
 
+        # Explicit casts aren't cached: Csv() or a lambda are usually new objects on every call
+        if not use_cache or not isinstance(cast, Undefined):
+            return self._cast(option, value, cast)
+
+        entry = self._cast_cache.get(option)
+        # by type too, as equal values of different types (0, False, 0.0) may not cast the same
+        if entry is not None and type(entry[0]) is type(value) and entry[0] == value:
+            self.cache_hits += 1
+            return entry[1]
+
+        self.cache_misses += 1
+        typed_value = self._cast(option, value, cast)
+        self._cast_cache[option] = (value, typed_value)
+        return typed_value
+
+    def _cast(self, option, value, cast):
         # Use Pydantic model for casting if available
         if isinstance(cast, Undefined):
             value = self._cast_with_pydantic(option, value)
@@ -89,8 +371,87 @@ class ConfigByModel(object):
 
         return value
 
+    def _observed_cast(self, option, value, cast):
+        start = time.perf_counter()
+        error = None
+        try:
+            return type(self)._cast(self, option, value, cast)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            self.observer.on_cast(option, time.perf_counter() - start, error)
+
+    def _value_source(self, option):
+        environ = self._environ if option in self._environ_fields else os.environ
+        if option in environ:
+            return "environ"
+        if option in self.repository:
+            return "repository"
+        return "default"
+
+    def get_many(self, options=None, as_model=False):
+        """
+        Return the values of several options (every model field by default) as a dict, validating them all
+        in one go. Some of the fields are validated by the same rules as get(), while every field is validated
+        by the model itself, with its validators and constraints. With as_model=True, return an instance of
+        the model, validated as a whole, instead.
+
+        Missing options and invalid values are all reported together in one ConfigValuesError.
+        """
+        options = list(self.models_by_field) if options is None else list(options)
+        fields = [option for option in options if option in self.models_by_field]
+        if as_model and len(fields) != len(options):
+            raise ValueError("Error: as_model requires every option to be a model field")
+
+        if self.settings is not None and len(fields) == len(options):
+            if as_model:
+                return self.settings
+            return {option: getattr(self.settings, option) for option in options}
+
+        whole_model = as_model or (fields and len(set(fields)) == len(self.models_by_field))
+        if whole_model:
+            fields = list(self.models_by_field)
+            options = list(dict.fromkeys(options + fields))
+
+        raw = {}
+        missing = []
+        for option in options:
+            environ = self._environ if option in self._environ_fields else os.environ
+            if option in self._snapshot_raw:
+                raw[option] = self._snapshot_raw[option]
+            elif option in environ:
+                raw[option] = environ[option]
+            elif option in self.repository:
+                raw[option] = self.repository[option]
+            elif option not in self.models_by_field:
+                missing.append(option)
+
+        errors = []
+        instance = None
+        if fields:
+            fields_model = self.model if whole_model else self.models_by_field.registry.get_many(self.model, fields)
+            try:
+                instance = fields_model.model_validate({option: _loads_json_object(raw[option]) for option in fields if option in raw})
+            except ValidationError as exc:
+                errors = exc.errors()
+
+        if missing or errors:
+            raise ConfigValuesError(missing, errors)
+        if as_model:
+            return instance
+        return {option: getattr(instance, option) if option in self.models_by_field else raw[option] for option in options}
+
+    def as_dict(self):
+        """Return the values of every model field, see get_many"""
+        return self.get_many()
+
     def __call__(self, *args, **kwargs):
         """
         Convenient shortcut to get.
         """
         return self.get(*args, **kwargs)
+
+
+class CRUDConfigByModel(ConfigByModel, CRUDConfig):
+    """Works the same as CRUDConfig but casts the values to the model."""
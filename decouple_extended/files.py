@@ -0,0 +1,76 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+def atomic_write(path, content: bytes, mode=None):
+    """
+    Replace the file at path with content, so readers only ever see the old or the new file.
+
+    The content is written to a temporary file in the same directory, flushed to disk and renamed over path.
+    The new file gets the given permission mode, or those of the file it replaces.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if mode is None:
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            pass
+
+    fd, tmp_path = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(path)), suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as file_:
+            file_.write(content)
+            file_.flush()
+            os.fsync(file_.fileno())
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    _fsync_directory(directory)
+
+
+def _fsync_directory(directory):
+    # Makes the rename itself durable. Not every platform lets a directory be opened, hence the best effort.
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive advisory lock for path while in the block.
+
+    The lock is taken on a separate path + ".lock" file, as path itself may be replaced by atomic_write while
+    locked. It isn't reentrant, and is a no-op on platforms without fcntl.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # closing the descriptor releases the lock
+        os.close(fd)
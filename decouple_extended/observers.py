@@ -0,0 +1,136 @@
+import bisect
+import os
+import threading
+import time
+from collections import Counter
+
+
+# Upper bounds, in seconds, of the latency histogram buckets of InMemoryObserver
+DEFAULT_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, float("inf"))
+
+
+class Observer:
+    """
+    Receives timings and outcomes from configs and AWS repositories given it as `observer`.
+
+    Every hook does nothing, subclasses override the ones they need. Durations are in seconds, and error
+    is the raised exception, if any.
+    """
+
+    def on_get(self, option, source, duration, error=None):
+        """A config read option. source is where its value came from: "environ", "repository" or "default"."""
+
+    def on_cast(self, option, duration, error=None):
+        """A config cast the value of option (with pydantic, unless a cast was given)"""
+
+    def on_remote_call(self, repository, operation, duration, size=None, error=None):
+        """An AWS repository loaded ("load") or saved ("save") its object, of size bytes once serialized"""
+
+
+class InMemoryObserver(Observer):
+    """
+    Aggregates what it observes in memory: counts of events and outcomes, latency histograms per event
+    and the top_n most read options.
+    """
+
+    def __init__(self, top_n=10, buckets=DEFAULT_BUCKETS):
+        self.top_n = top_n
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # by (event, outcome), e.g. ("get", "environ"), ("cast", "error") or ("load", "ok")
+            self.counts = Counter()
+            self.histograms = {}
+            self.keys = Counter()
+            self.payload_bytes = Counter()
+
+    def top_keys(self, n=None):
+        with self._lock:
+            return self.keys.most_common(n or self.top_n)
+
+    def snapshot(self):
+        """Return everything aggregated so far as plain, JSON serializable, data"""
+        with self._lock:
+            return {
+                "counts": {"{}.{}".format(*key): count for key, count in self.counts.items()},
+                "histograms": {event: dict(zip(map(str, self.buckets), counts)) for event, counts in self.histograms.items()},
+                "top_keys": self.keys.most_common(self.top_n),
+                "payload_bytes": dict(self.payload_bytes),
+            }
+
+    def _record(self, event, outcome, duration):
+        self.counts[event, outcome] += 1
+        histogram = self.histograms.get(event)
+        if histogram is None:
+            histogram = self.histograms[event] = [0] * len(self.buckets)
+        histogram[bisect.bisect_left(self.buckets, duration)] += 1
+
+    def on_get(self, option, source, duration, error=None):
+        with self._lock:
+            self._record("get", "error" if error is not None else source, duration)
+            self.keys[option] += 1
+
+    def on_cast(self, option, duration, error=None):
+        with self._lock:
+            self._record("cast", "error" if error is not None else "ok", duration)
+
+    def on_remote_call(self, repository, operation, duration, size=None, error=None):
+        with self._lock:
+            self._record(operation, "error" if error is not None else "ok", duration)
+            if size is not None:
+                self.payload_bytes[operation] += size
+
+
+class ObservableMixin:
+    """
+    Adds an `observer` attribute. While it's set, each method listed in observed_methods is replaced on the
+    instance by its _observed_ variant (e.g. _observed_get for get), which reports to the observer. Without
+    an observer nothing is replaced, so observing costs nothing unless used.
+    """
+
+    observed_methods = ()
+    _observer = None
+
+    @property
+    def observer(self):
+        return self._observer
+
+    @observer.setter
+    def observer(self, observer):
+        self._observer = observer
+        for name in self.observed_methods:
+            observed = getattr(self, "_observed_" + name.lstrip("_"), None)
+            if observed is None:
+                continue
+            if observer is None:
+                self.__dict__.pop(name, None)
+            else:
+                self.__dict__[name] = observed
+
+
+class ObservableConfigMixin(ObservableMixin):
+    """Reports every get of a config, with the source of its value, to its observer"""
+
+    observed_methods = ("get",)
+
+    def _observed_get(self, option, *args, **kwargs):
+        start = time.perf_counter()
+        error = None
+        try:
+            # the class' get, as the instance one is this method
+            return type(self).get(self, option, *args, **kwargs)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            self.observer.on_get(option, self._value_source(option), time.perf_counter() - start, error)
+
+    def _value_source(self, option):
+        if option in os.environ:
+            return "environ"
+        if option in self.repository:
+            return "repository"
+        return "default"
@@ -1,24 +1,367 @@
 import json
+import logging
+import os
+import threading
+import time
+import weakref
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
-import boto3
 from decouple import UndefinedValueError
 
+from .aio import run_blocking
+from .clients import client_pool as default_client_pool
+from .files import atomic_write
+from .observers import ObservableMixin
 
-class RepositoryAWSSecrets:
+
+logger = logging.getLogger(__name__)
+
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+}
+
+
+class ChangeListenersMixin:
+    """
+    Lets other objects register callbacks to be notified when a key changes.
+
+    Callbacks receive the changed key. Bound methods are held weakly so a listener doesn't keep its owner alive.
+    Exceptions raised by callbacks are logged.
+    """
+
+    def add_listener(self, callback):
+        if hasattr(callback, "__self__") and hasattr(callback, "__func__"):
+            callback = weakref.WeakMethod(callback)
+        else:
+            callback = _StrongRef(callback)
+        self.__dict__.setdefault("_listeners", []).append(callback)
+
+    def remove_listener(self, callback):
+        listeners = self.__dict__.get("_listeners", [])
+        listeners[:] = [ref for ref in listeners if ref() is not None and ref() != callback]
+
+    def _notify(self, key):
+        # a failing listener doesn't keep the others from being notified, nor fails the change
+        for ref in list(self.__dict__.get("_listeners", ())):
+            callback = ref()
+            if callback is not None:
+                try:
+                    callback(key)
+                except Exception:
+                    logger.exception("Listener of %s failed on %s", type(self).__name__, key)
+
+    def _notify_changes(self, previous_data, data):
+        """Notify every key whose value differs between two versions of the data. Returns the added, removed and modified keys."""
+        added = [key for key in data if key not in previous_data]
+        removed = [key for key in previous_data if key not in data]
+        modified = [key for key in data if key in previous_data and previous_data[key] != data[key]]
+        for key in added + removed + modified:
+            self._notify(key)
+        return added, removed, modified
+
+
+class _StrongRef:
+    """Mimics weakref's call interface for callbacks that must be kept alive"""
+
+    __slots__ = ("callback",)
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self):
+        return self.callback
+
+
+class BaseAWSRepository(ChangeListenersMixin, ObservableMixin):
+    """
+    Common behaviour of the repositories whose options are the keys of a JSON object stored in AWS.
+
+    Given a refresh_interval (in seconds), a daemon thread fetches the object again every interval and
+    swaps `data` for the new copy, so reads never wait for AWS. If a fetch fails the last good copy keeps
+    being served.
+
+    `version` holds the AWS version of the loaded object; refreshing doesn't parse nor replace `data` when
+    it hasn't moved.
+
+    Given a cache_path, every loaded object is also saved to that local file. Later instances start from
+    the file when it is younger than cache_max_age seconds (or at any age if cache_max_age is None) and
+    revalidate it against AWS in the background. An older file is still used when AWS throttles the first
+    fetch. Set cache_key_env to the name of an environment variable holding a Fernet key to encrypt the
+    file, which requires the cryptography package.
+
+    With lazy=True nothing is done at construction: the client is created and the object loaded the first
+    time the repository is read.
+
+    Unless a client is given, it's taken from client_pool (the process-wide one by default) for the given
+    region and profile, so repositories share clients and connections.
+
+    Repositories can be created before forking (e.g. in a gunicorn master with preload_app): forked
+    processes keep the loaded object, drop the clients taken from the pool (boto3 clients aren't fork-safe)
+    to create them again on first use, and start a running background refresh again. preload=True loads
+    the object right away (it can't be combined with lazy) and keeps `data` as a read-only mapping, so it
+    can't be changed by mistake. CRUD writes turn it back into a dict.
+
+    Given an observer (see decouple_extended.observers), every load (and save, for CRUD repositories) is timed
+    and reported to it.
+    """
+
+    service_name = None
+    observed_methods = ("_load", "_save_data")
+
+    def __init__(
+        self,
+        refresh_interval=None,
+        cache_path=None,
+        cache_max_age=None,
+        cache_key_env=None,
+        lazy=False,
+        client=None,
+        region_name=None,
+        profile_name=None,
+        client_pool=None,
+        observer=None,
+        preload=False,
+    ):
+        if preload and lazy:
+            raise ValueError("Error: a preloaded repository can't be lazy")
+
+        self.observer = observer
+        self.preload = preload
+        self._pooled_client = client is None
+        if client is not None:
+            self.client = client
+        self.region_name = region_name
+        self.profile_name = profile_name
+        self.client_pool = client_pool if client_pool is not None else default_client_pool
+        self.version = None
+        self.cache_path = cache_path
+        self.cache_max_age = cache_max_age
+        self._cache_cipher = _cache_cipher(cache_key_env) if cache_path and cache_key_env else None
+        self.refresh_interval = refresh_interval
+        self._refresh_stopped = threading.Event()
+        self._refreshing = False
+        self._materialize_lock = threading.RLock()
+        # held while `data` is replaced or written to
+        self._data_lock = threading.RLock()
+        _repositories.add(self)
+
+        if not lazy:
+            self._materialize()
+
+    def __getattr__(self, name):
+        # Only called while `client` or `data` haven't been created yet, which is the case in lazy mode
+        if name == "client":
+            with self._materialize_lock:
+                if "client" not in self.__dict__:
+                    self.client = self.client_pool.get(self.service_name, self.region_name, self.profile_name)
+            return self.__dict__["client"]
+        if name == "data":
+            self._materialize()
+            return self.__dict__["data"]
+        raise AttributeError("{!r} object has no attribute {!r}".format(type(self).__name__, name))
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def _materialize(self):
+        with self._materialize_lock:
+            if "data" in self.__dict__:
+                return
+            self._load_initial_data()
+            if self.refresh_interval:
+                self.start_refresh()
+
+    def _load_initial_data(self):
+        cached, age = self._read_cache() if self.cache_path else (None, None)
+        if cached is not None and (self.cache_max_age is None or age <= self.cache_max_age):
+            self._restore_cache(cached)
+            threading.Thread(target=_try_refresh, args=(self,), name="{}-revalidate".format(type(self).__name__), daemon=True).start()
+            return
+
+        try:
+            self.refresh()
+        except Exception as exc:
+            if cached is None or _error_code(exc) not in THROTTLING_ERROR_CODES:
+                raise
+            logger.warning("%s was throttled by AWS, using the local cache from %s", type(self).__name__, self.cache_path)
+            self._restore_cache(cached)
+
+    def refresh(self) -> bool:
+        """Fetch the object from AWS and replace `data` with it. Returns whether a new version was loaded."""
+        with self._data_lock:
+            previous_data = self.__dict__.get("data", {})
+            loaded = self._load()
+            if loaded:
+                self._freeze_data()
+                self._write_cache()
+                self._loaded()
+                self._notify_changes(previous_data, self.data)
+            return loaded
+
+    def _load(self) -> bool:
+        raise NotImplementedError
+
+    def _loaded(self):
+        """Hook called once a new version of the object replaced `data`, before listeners are notified"""
+
+    def _observed_load(self):
+        start = time.perf_counter()
+        error = None
+        loaded = False
+        try:
+            loaded = type(self)._load(self)
+            return loaded
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            size = len(json.dumps(dict(self.data))) if loaded else None
+            self.observer.on_remote_call(self, "load", time.perf_counter() - start, size, error)
+
+    async def aload(self):
+        """Create the client and load the object if not done yet (see lazy), without blocking the event loop"""
+        await run_blocking(self._materialize)
+
+    async def arefresh(self) -> bool:
+        """Same as refresh, without blocking the event loop"""
+        return await run_blocking(self.refresh)
+
+    def _read_cache(self):
+        """Return the cached state and its age in seconds, or (None, None) if there is no usable cache file"""
+        try:
+            with open(self.cache_path, "rb") as file_:
+                content = file_.read()
+                age = time.time() - os.fstat(file_.fileno()).st_mtime
+            if self._cache_cipher is not None:
+                content = self._cache_cipher.decrypt(content)
+            return json.loads(content), age
+        except FileNotFoundError:
+            return None, None
+        except Exception:
+            logger.warning("Ignoring unreadable local cache %s", self.cache_path, exc_info=True)
+            return None, None
+
+    def _freeze_data(self):
+        if self.preload and not isinstance(self.data, MappingProxyType):
+            self.data = MappingProxyType(self.data)
+
+    def _cache_state(self):
+        return {"data": dict(self.data), "version": self.version}
+
+    def _restore_cache(self, cached):
+        self.data, self.version = cached["data"], cached["version"]
+        self._freeze_data()
+
+    def _write_cache(self):
+        if not self.cache_path:
+            return
+        content = json.dumps(self._cache_state()).encode()
+        if self._cache_cipher is not None:
+            content = self._cache_cipher.encrypt(content)
+        try:
+            atomic_write(self.cache_path, content, mode=0o600)
+        except OSError:
+            logger.warning("Could not write local cache %s", self.cache_path, exc_info=True)
+
+    def start_refresh(self):
+        self._refreshing = True
+        self._refresh_stopped.clear()
+        thread = threading.Thread(
+            target=_refresh_periodically,
+            args=(weakref.ref(self), self.refresh_interval, self._refresh_stopped),
+            name="{}-refresh".format(type(self).__name__),
+            daemon=True,
+        )
+        thread.start()
+
+    def stop_refresh(self):
+        self._refreshing = False
+        self._refresh_stopped.set()
+
+    def _after_fork(self):
+        # Only the forking thread survives in the child, so locks held by other threads are recreated and
+        # the refresh thread started again. Clients given by the caller can't be recreated and are kept.
+        if self._pooled_client:
+            self.__dict__.pop("client", None)
+        self._materialize_lock = threading.RLock()
+        self._data_lock = threading.RLock()
+        self._refresh_stopped = threading.Event()
+        if self._refreshing:
+            self.start_refresh()
+
+
+# Every AWS repository of the process, reset in forked processes
+_repositories = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for repository in list(_repositories):
+        repository._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _cache_cipher(key_env):
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        raise ImportError("Encrypting the local cache requires the cryptography package, install decouple-extended[cache-encryption]")
+
+    try:
+        return Fernet(os.environ[key_env])
+    except KeyError:
+        raise ValueError("Error: {} must hold the key used to encrypt the local cache".format(key_env))
+
+
+def _error_code(exc):
+    # botocore's ClientError carries the AWS error code in its response
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return None
+
+
+def _try_refresh(repository):
+    try:
+        repository.refresh()
+    except Exception:
+        logger.warning("Could not refresh %s, keeping the last loaded data", type(repository).__name__, exc_info=True)
+
+
+def _refresh_periodically(repository_ref, interval, stopped):
+    # Only a weak reference is kept between refreshes so the thread ends once the repository is gone
+    while not stopped.wait(interval):
+        repository = repository_ref()
+        if repository is None:
+            return
+        _try_refresh(repository)
+        del repository
+
+
+class RepositoryAWSSecrets(BaseAWSRepository):
     """
     Retrieves option keys from AWS Secrets Manager.
     """
 
     # Usage:
     # aws_secrets_repository = RepositoryAWSSecrets(secret_name="my_secret_name")
+    # or, to pick up rotated values every 5 minutes:
+    # aws_secrets_repository = RepositoryAWSSecrets(secret_name="my_secret_name", refresh_interval=300)
 
-    def __init__(self, secret_name):
-        self.secret_name = secret_name
-        self.client = boto3.client("secretsmanager")
-        self._load_secrets(secret_name)
+    service_name = "secretsmanager"
 
-    def __contains__(self, key):
-        return key in self.data
+    def __init__(self, secret_name, **kwargs):
+        self.secret_name = secret_name
+        super().__init__(**kwargs)
 
     def __getitem__(self, key):
         try:
@@ -26,26 +369,38 @@ class RepositoryAWSSecrets:
         except KeyError:
             raise UndefinedValueError("{} not found in AWS Secrets. Declare it as envvar or define a default value.".format(key))
 
+    def _load(self):
+        return self._load_secrets(self.secret_name)
+
     def _load_secrets(self, secret_name):
+        if self.version is not None:
+            # describe_secret only returns metadata, so there's no payload to download when nothing changed
+            stages = self.client.describe_secret(SecretId=secret_name).get("VersionIdsToStages", {})
+            if "AWSCURRENT" in stages.get(self.version, ()):
+                return False
+
         response = self.client.get_secret_value(SecretId=secret_name)
+        if response.get("VersionId") is not None and response["VersionId"] == self.version:
+            return False
+
         if "SecretString" in response:
             self.data = json.loads(response["SecretString"])
         else:
             self.data = {}
+        self.version = response.get("VersionId")
+        return True
 
 
-class RepositoryAWSParameterStore:
+class RepositoryAWSParameterStore(BaseAWSRepository):
     """
     Retrieves option keys from AWS Systems Manager Parameter Store.
     """
 
-    def __init__(self, parameter_store_name):
-        self.parameter_store_name = parameter_store_name
-        self.client = boto3.client("ssm")
-        self._load_parameters(parameter_store_name)
+    service_name = "ssm"
 
-    def __contains__(self, key):
-        return key in self.data
+    def __init__(self, parameter_store_name, **kwargs):
+        self.parameter_store_name = parameter_store_name
+        super().__init__(**kwargs)
 
     def __getitem__(self, key):
         try:
@@ -55,9 +410,297 @@ class RepositoryAWSParameterStore:
                 "{} not found in AWS Systems Manager Parameter Store. Declare it as an envvar or define a default value.".format(key)
             )
 
+    def _load(self):
+        return self._load_parameters(self.parameter_store_name)
+
     def _load_parameters(self, parameter_store_name):
         response = self.client.get_parameter(Name=parameter_store_name, WithDecryption=True)
-        if "Parameter" in response and "Value" in response["Parameter"]:
-            self.data = json.loads(response["Parameter"]["Value"])
+        parameter = response.get("Parameter", {})
+        if parameter.get("Version") is not None and parameter["Version"] == self.version:
+            return False
+
+        if "Value" in parameter:
+            self.data = json.loads(parameter["Value"])
         else:
             self.data = {}
+        self.version = parameter.get("Version")
+        return True
+
+
+class RepositoryAWSParameterStorePath(BaseAWSRepository):
+    """
+    Retrieves option keys from every parameter under a path of AWS Systems Manager Parameter Store.
+
+    Each parameter is one option, named after its path relative to the given one, e.g. with path "/app/prod"
+    the parameter "/app/prod/DEBUG" is the option "DEBUG" (and "/app/prod/db/HOST" is "db/HOST" unless
+    recursive=False, which only loads the parameters directly under the path).
+    """
+
+    # Usage:
+    # aws_parameters_repository = RepositoryAWSParameterStorePath(path="/app/prod/")
+
+    service_name = "ssm"
+
+    def __init__(self, path, recursive=True, **kwargs):
+        self.path = "/" + path.strip("/")
+        self.recursive = recursive
+        super().__init__(**kwargs)
+
+    def __getitem__(self, key):
+        try:
+            return self.data[key]
+        except KeyError:
+            raise UndefinedValueError(
+                "{} not found in AWS Systems Manager Parameter Store path {}. Declare it as an envvar or define a default value.".format(
+                    key, self.path
+                )
+            )
+
+    def _load(self):
+        return self._load_parameters_by_path(self.path)
+
+    def _load_parameters_by_path(self, path):
+        prefix = path.rstrip("/") + "/"
+        prefix_length = len(prefix)
+        data = {}
+        versions = []
+        paginator = self.client.get_paginator("get_parameters_by_path")
+        for page in paginator.paginate(Path=path, Recursive=self.recursive, WithDecryption=True):
+            for parameter in page["Parameters"]:
+                key = parameter["Name"][prefix_length:] if parameter["Name"].startswith(prefix) else parameter["Name"]
+                data[key] = parameter["Value"]
+                versions.append([parameter["Name"], parameter["Version"]])
+
+        # parameters have their own versions, so the loaded set is versioned by all of them
+        versions.sort()
+        if versions == self.version:
+            return False
+
+        self.data = data
+        self.version = versions
+        return True
+
+
+class RepositoryAWSSecretsMulti(BaseAWSRepository):
+    """
+    Retrieves option keys from several AWS Secrets Manager secrets, each holding a JSON object.
+
+    All secrets are fetched at once, with BatchGetSecretValue when the client and its permissions allow it,
+    or else concurrently with up to max_workers threads. They are merged in the given order, so keys of
+    later secrets override those of earlier ones, and `sources` tells the secret each key was read from.
+    """
+
+    # Usage:
+    # aws_secrets_repository = RepositoryAWSSecretsMulti(["shared_secret", "service_secret"])
+
+    service_name = "secretsmanager"
+    batch_size = 20  # the most secrets BatchGetSecretValue accepts by call
+
+    def __init__(self, secret_names, max_workers=None, **kwargs):
+        self.secret_names = list(secret_names)
+        self.max_workers = max_workers
+        self.sources = {}
+        super().__init__(**kwargs)
+
+    def __getitem__(self, key):
+        try:
+            return self.data[key]
+        except KeyError:
+            raise UndefinedValueError("{} not found in AWS Secrets. Declare it as envvar or define a default value.".format(key))
+
+    def _load(self):
+        return self._load_secrets(self.secret_names)
+
+    def _load_secrets(self, secret_names):
+        try:
+            responses = self._batch_get_secret_values(secret_names)
+        except Exception:
+            logger.debug("Could not use BatchGetSecretValue, fetching secrets one by one", exc_info=True)
+            with ThreadPoolExecutor(max_workers=self.max_workers or max(len(secret_names), 1)) as executor:
+                responses = dict(zip(secret_names, executor.map(lambda name: self.client.get_secret_value(SecretId=name), secret_names)))
+
+        versions = [[name, responses[name].get("VersionId")] for name in secret_names]
+        if versions == self.version:
+            return False
+
+        data = {}
+        sources = {}
+        for name in secret_names:
+            values = json.loads(responses[name]["SecretString"]) if "SecretString" in responses[name] else {}
+            data.update(values)
+            sources.update(dict.fromkeys(values, name))
+
+        self.data, self.sources, self.version = data, sources, versions
+        return True
+
+    def _batch_get_secret_values(self, secret_names):
+        responses = {}
+        for start in range(0, len(secret_names), self.batch_size):
+            end = start + self.batch_size
+            batch = secret_names[start:end]
+            kwargs = {"SecretIdList": batch}
+            while True:
+                response = self.client.batch_get_secret_value(**kwargs)
+                if response.get("Errors"):
+                    raise LookupError("BatchGetSecretValue failed for {}".format([error.get("SecretId") for error in response["Errors"]]))
+                for secret in response["SecretValues"]:
+                    responses[secret["Name"]] = responses[secret["ARN"]] = secret
+                if not response.get("NextToken"):
+                    break
+                kwargs["NextToken"] = response["NextToken"]
+
+        return {name: responses[name] for name in secret_names}
+
+    def _cache_state(self):
+        return dict(super()._cache_state(), sources=self.sources)
+
+    def _restore_cache(self, cached):
+        super()._restore_cache(cached)
+        self.sources = cached.get("sources", {})
+
+
+class RepositoryChain(ChangeListenersMixin):
+    """
+    Retrieves option keys from several repositories, the first one having a key taking precedence.
+
+    Layers may be repositories (python-decouple's, or this package's) or plain mappings such as os.environ.
+    They are merged into a single dict when the chain is built and on refresh(), so every lookup is one dict
+    access, and layers reporting their changes are re-merged key by key as they happen. source_of() tells
+    the layer a key was read from. Keys of ini layers are matched whatever their case, as they are when the
+    ini repository is used on its own.
+    """
+
+    # Usage:
+    # repository = RepositoryChain([os.environ, RepositoryEnv(".env"), RepositoryAWSParameterStore("config"), RepositoryAWSSecrets("secret")])
+
+    def __init__(self, layers):
+        self.layers = list(layers)
+        # ini layers don't tell keys apart by case, so their keys are also looked up in lowercase
+        self._folded_layers = [index for index, layer in enumerate(self.layers) if _is_case_insensitive(layer)]
+        for layer in self.layers:
+            if hasattr(layer, "add_listener"):
+                layer.add_listener(self._layer_changed)
+        self._merge()
+
+    def __contains__(self, key):
+        if key in self.data:
+            return True
+        return bool(self._folded_layers) and key.lower() in self._folded
+
+    def __getitem__(self, key):
+        if not self._folded_layers and key in self.data:
+            return self.data[key]
+        found = self._find(key)
+        if found is None:
+            raise UndefinedValueError("{} not found in any layer. Declare it as envvar or define a default value.".format(key))
+        return found[1]
+
+    def source_of(self, key):
+        """Return the layer the value of key comes from"""
+        found = self._find(key)
+        if found is None:
+            raise KeyError(key)
+        return self.layers[found[0]]
+
+    def refresh(self):
+        """Refresh the layers that can be refreshed, then merge all of them again"""
+        for layer in self.layers:
+            if hasattr(layer, "refresh"):
+                layer.refresh()
+        previous_data = self.data
+        self._merge()
+        self._notify_changes(previous_data, self.data)
+
+    def _find(self, key):
+        # (index of the layer, value) of key in the first layer having it, or None
+        found = None
+        index = self.sources.get(key)
+        if index is not None:
+            found = index, self.data[key]
+        if self._folded_layers:
+            folded = self._folded.get(key.lower())
+            if folded is not None and (found is None or folded[0] < found[0]):
+                found = folded
+        return found
+
+    def _merge(self):
+        data = {}
+        sources = {}
+        folded = {}
+        for index in reversed(range(len(self.layers))):
+            layer_data = _layer_data(self.layers[index])
+            data.update(layer_data)
+            sources.update(dict.fromkeys(layer_data, index))
+            if index in self._folded_layers:
+                folded.update((key, (index, value)) for key, value in layer_data.items())
+        self.data, self.sources, self._folded = data, sources, folded
+
+    def _layer_changed(self, key):
+        notified = self._merge_key(key)
+        if self._folded_layers:
+            # ini layers report the key as it was written, but hold it in lowercase
+            folded_key = key.lower()
+            if folded_key != key:
+                self._merge_key(folded_key)
+            if self._fold_key(folded_key) and not notified:
+                self._notify(key)
+
+    def _merge_key(self, key):
+        for index, layer in enumerate(self.layers):
+            found, value = _layer_lookup(layer, key)
+            if found:
+                if self.data.get(key, _missing) != value or self.sources.get(key) != index:
+                    self.data[key] = value
+                    self.sources[key] = index
+                    self._notify(key)
+                    return True
+                return False
+
+        if key in self.data:
+            del self.data[key]
+            del self.sources[key]
+            self._notify(key)
+            return True
+        return False
+
+    def _fold_key(self, folded_key):
+        previous = self._folded.get(folded_key)
+        for index in self._folded_layers:
+            found, value = _layer_lookup(self.layers[index], folded_key)
+            if found:
+                self._folded[folded_key] = index, value
+                break
+        else:
+            self._folded.pop(folded_key, None)
+        return self._folded.get(folded_key) != previous
+
+
+_missing = object()
+
+
+def _is_case_insensitive(layer):
+    # RepositoryIni, whose ConfigParser stores options in lowercase
+    return not isinstance(layer, Mapping) and hasattr(layer, "parser")
+
+
+def _layer_data(layer):
+    if isinstance(layer, Mapping):
+        return dict(layer)
+    if hasattr(layer, "parser"):
+        # RepositoryIni, whose values are read through the parser for interpolation
+        section = layer.SECTION
+        return {key: layer.parser.get(section, key) for key in layer.parser.options(section)} if layer.parser.has_section(section) else {}
+    if hasattr(layer, "data"):
+        return dict(layer.data)
+    raise TypeError("Error: {} can't be used as a layer".format(type(layer).__name__))
+
+
+def _layer_lookup(layer, key):
+    # by the exact key, as held in the merged data: ini layers only have lowercase keys there
+    if isinstance(layer, Mapping):
+        return (True, layer[key]) if key in layer else (False, None)
+    if hasattr(layer, "parser"):
+        if key != key.lower() or not layer.parser.has_option(layer.SECTION, key):
+            return False, None
+        return True, layer.parser.get(layer.SECTION, key)
+    return (True, layer.data[key]) if key in layer.data else (False, None)
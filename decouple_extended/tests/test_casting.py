@@ -9,10 +9,16 @@ import pytest
 from moto import mock_secretsmanager  # noqa F401
 from moto import mock_ssm  # noqa F401
 from pydantic import BaseModel
+from pydantic import ConfigDict
+from pydantic import Field
 from pydantic import Json
+from pydantic import ValidationError
 
 from decouple_extended import crud
 from decouple_extended.extensions import ConfigByModel
+from decouple_extended.extensions import ConfigValuesError
+from decouple_extended.extensions import FieldModelRegistry
+from decouple_extended.extensions import FieldModels
 
 
 class DummyModel(BaseModel):
@@ -188,3 +194,282 @@ def test_crud_casting_aws_by_pydantic(repo_cls, aws_service, aws_method, aws_kwa
         assert config("int1") is None
 
         assert config.list() == ["dict1", "bool1"]
+
+
+def test_cast_cache_by_pydantic():
+    """Tests that ConfigByModel caches typed values and drops them when the key is written"""
+    m = mock_open(read_data='int1=1337\ndict1={"foo":"bar"}\n')
+
+    with patch("builtins.open", m), patch("decouple.open", m):
+        config = crud.CRUDConfigByModel(crud.CRUDRepositoryEnv("/path/to/config_file"), DummyModel)
+
+        assert config("dict1") == {"foo": "bar"}
+        assert config("dict1") == {"foo": "bar"}
+        assert config.cache_info().hits == 1
+        assert config.cache_info().misses == 1
+
+        # opting out neither reads nor fills the cache
+        assert config("int1", use_cache=False) == 1337
+        assert config.cache_info() == (1, 1, 1)
+
+        config.update("dict1", {"foo": "baz"})
+        assert config.cache_info().currsize == 0
+        assert config("dict1") == {"foo": "baz"}
+
+        # writes made straight to the repository invalidate the cache too
+        config.repository.set("dict1", {"foo": "qux"})
+        assert config.cache_info().currsize == 0
+        assert config("dict1") == {"foo": "qux"}
+
+        # explicit casts, often created on every call, don't grow the cache
+        for _ in range(10):
+            assert config("int1", cast=lambda value: int(value) + 1) == 1338
+        assert config.cache_info().currsize == 1
+
+    class DefaultsModel(BaseModel):
+        flag: Union[int, bool] = 0
+
+    m = mock_open(read_data="")
+
+    with patch("builtins.open", m), patch("decouple.open", m):
+        config = ConfigByModel(crud.CRUDRepositoryEnv("/path/to/config_file"), DefaultsModel)
+
+        # equal values of different types aren't served each other's cast
+        assert config("flag") == 0
+        config.repository.data["flag"] = False
+        assert config("flag") is False
+
+
+def test_snapshot_by_pydantic():
+    """Tests that ConfigByModel in snapshot mode validates the model once and serves get() from it"""
+    m = mock_open(read_data='int1=1337\ndict1={"foo":"bar"}\n')
+
+    with patch("builtins.open", m), patch("decouple.open", m):
+        config = crud.CRUDConfigByModel(crud.CRUDRepositoryEnv("/path/to/config_file"), DummyModel, snapshot=True)
+
+        assert config.settings.int1 == 1337
+        assert config("dict1") == {"foo": "bar"}
+        assert config("bool1") is None
+        assert config("int1", cast=str) == "1337"
+
+        # no single-field model is needed to serve the snapshot
+        assert config.models_by_field._models == {}
+
+        # an explicit default is still cast, here by the fast path of simple types
+        assert config("bool1", default=True) is True
+        assert config.models_by_field._models == {}
+
+        with pytest.raises(ValidationError):
+            config.settings.int1 = 1
+
+        # writing a field takes a new snapshot
+        config.set("bool1", True)
+        assert config.settings.bool1 is True
+        assert config("bool1") is True
+
+
+def test_snapshot_of_unfrozen_model_by_pydantic():
+    """Tests that snapshot mode freezes the settings of a model explicitly configured as not frozen"""
+
+    class UnfrozenModel(BaseModel):
+        model_config = ConfigDict(frozen=False, str_strip_whitespace=True)
+
+        name: str = "web"
+
+    m = mock_open(read_data='name=" api "\n')
+
+    with patch("builtins.open", m), patch("decouple.open", m):
+        config = ConfigByModel(crud.CRUDRepositoryEnv("/path/to/config_file"), UnfrozenModel, snapshot=True)
+
+        assert config("name") == "api"
+        assert isinstance(config.settings, UnfrozenModel)
+        with pytest.raises(ValidationError):
+            config.settings.name = "other"
+
+
+def test_field_models_are_shared_by_model_class():
+    """Tests that single-field models are built once per model class and can be dropped with the registry"""
+    registry = FieldModelRegistry(maxsize=1)
+
+    first = FieldModels(DummyModel, registry)
+    second = FieldModels(DummyModel, registry)
+    assert first["int1"] is second["int1"]
+    assert first["int1"].model_validate({"int1": "1"}).int1 == 1
+
+    class OtherModel(BaseModel):
+        int1: int = 0
+
+    # only the most recently used model class is kept
+    assert FieldModels(OtherModel, registry)["int1"] is not first["int1"]
+    assert len(registry) == 1
+    assert FieldModels(DummyModel, registry)["int1"] is not first["int1"]
+
+    # and so are the models made of several fields
+    int1_model = registry.get_many(DummyModel, ["int1"])
+    assert registry.get_many(DummyModel, ["int1"]) is int1_model
+    assert registry.get_many(DummyModel, ["int1", "bool1"]) is not int1_model
+    assert registry.get_many(DummyModel, ["int1"]) is not int1_model
+
+    registry.clear()
+    assert len(registry) == 0
+
+
+class InlineExecutor:
+    """Runs subscribers right away, to test them without threads"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+def test_subscribe_by_pydantic(tmp_path):
+    """Tests that CRUDConfigByModel subscribers get the old and new typed values of the keys they watch"""
+    source = tmp_path / ".env"
+    source.write_text("int1=1337\n")
+
+    config = crud.CRUDConfigByModel(crud.CRUDRepositoryEnv(str(source), watch_interval=60), DummyModel)
+    changes = []
+    unsubscribe = config.subscribe(["int1", "bool1"], lambda *change: changes.append(change), executor=InlineExecutor())
+
+    config.update("int1", 1)
+    config.set("bool1", True)
+    config.set("dict1", {"foo": "bar"})  # not watched
+    config.delete("int1")
+    assert changes == [("int1", 1337, 1), ("bool1", None, True), ("int1", 1, None)]
+
+    # changes made by other processes are reported when the file is reloaded
+    source.write_text("bool1=false\n")
+    config.repository.check_for_changes()
+    assert changes[-1] == ("bool1", True, False)
+
+    unsubscribe()
+    config.set("int1", 2)
+    assert len(changes) == 4
+
+
+def test_snapshot_invalid_write_by_pydantic(tmp_path):
+    """Tests that an invalid write in snapshot mode doesn't fail nor leave get() serving the stale snapshot"""
+    source = tmp_path / ".env"
+    source.write_text('int1=1337\ndict1={"foo": "bar"}\n')
+
+    config = crud.CRUDConfigByModel(crud.CRUDRepositoryEnv(str(source)), DummyModel, snapshot=True)
+    changes = []
+    config.subscribe("int1", lambda *change: changes.append(change), executor=InlineExecutor())
+
+    config.update("int1", "eighty")
+    assert config.settings is None
+    with pytest.raises(ValidationError):
+        config("int1")
+
+    config.update("int1", 8000)
+    assert config.settings.int1 == 8000
+    assert config("int1") == 8000
+    assert changes == [("int1", 1337, 8000)]
+
+
+def test_snapshot_env_by_pydantic(monkeypatch):
+    """Tests that ConfigByModel with snapshot_env reads model fields from a copy of the environment"""
+    monkeypatch.setenv("int1", "1")
+    monkeypatch.setenv("OTHER", "other")
+    m = mock_open(read_data='int1=1337\ndict1={"foo":"bar"}\n')
+
+    with patch("builtins.open", m), patch("decouple.open", m):
+        config = ConfigByModel(crud.CRUDRepositoryEnv("/path/to/config_file"), DummyModel, snapshot_env=True)
+
+    assert config("int1") == 1
+    monkeypatch.setenv("int1", "2")
+    monkeypatch.setenv("OTHER", "new_other")
+    assert config("int1") == 1
+    assert config("OTHER") == "new_other"  # not a model field, so read from os.environ
+
+    config.refresh_env()
+    assert config("int1") == 2
+
+    monkeypatch.delenv("int1")
+    config.refresh_env()
+    assert config("int1") == 1337
+
+    # without snapshot_env os.environ is always read, refresh_env() or not
+    with patch("builtins.open", m), patch("decouple.open", m):
+        config = ConfigByModel(crud.CRUDRepositoryEnv("/path/to/config_file"), DummyModel, snapshot=True)
+    config.refresh_env()
+    monkeypatch.setenv("int1", "3")
+    config.refresh()
+    assert config("int1") == 3
+
+
+def test_get_many_by_pydantic():
+    """Tests that ConfigByModel.get_many validates many options at once and reports all their errors together"""
+    m = mock_open(read_data='int1=1337\ndict1={"foo":"bar"}\nbool1=maybe\nOTHER=other\n')
+
+    with patch("builtins.open", m), patch("decouple.open", m):
+        config = ConfigByModel(crud.CRUDRepositoryEnv("/path/to/config_file"), DummyModel)
+
+        assert config.get_many(["int1", "dict1", "OTHER"]) == {"int1": 1337, "dict1": {"foo": "bar"}, "OTHER": "other"}
+
+        with pytest.raises(ConfigValuesError) as exc_info:
+            config.get_many(["int1", "bool1", "UNDEFINED1", "UNDEFINED2"])
+        assert exc_info.value.missing == ["UNDEFINED1", "UNDEFINED2"]
+        assert [error["loc"] for error in exc_info.value.errors] == [("bool1",)]
+
+        config.repository.set("bool1", "true")
+        assert config.as_dict() == {"int1": 1337, "dict1": {"foo": "bar"}, "bool1": True}
+        assert isinstance(config.get_many(["bool1", "dict1", "int1"], as_model=True), DummyModel)
+        assert config.get_many(["int1"], as_model=True).int1 == 1337
+
+
+class SimpleTypesModel(BaseModel):
+    """Model mixing fields cast by the fast path of simple types with fields cast by their own model"""
+
+    port: int
+    ratio: Optional[float] = None
+    name: str = "web"
+    workers: int = Field(default=1, gt=0)
+    options: dict = {}
+
+
+def test_simple_types_fast_path():
+    """Tests that simple fields are cast without single-field models, with the same results and errors"""
+    m = mock_open(read_data='port=8000\nratio=0.5\nname={"a": 1}\nworkers=0\noptions={"a": 1}\nbad_port=eighty\n')
+
+    with patch("builtins.open", m), patch("decouple.open", m):
+        config = ConfigByModel(crud.CRUDRepositoryEnv("/path/to/config_file"), SimpleTypesModel)
+
+        assert set(config.models_by_field.adapters) == {"port", "ratio", "name"}
+        assert config("port") == 8000
+        assert config("ratio") == 0.5
+        assert config.models_by_field._models == {}
+
+        # a failed fast cast is done again by the field's model, so errors don't depend on the path taken
+        with pytest.raises(ValidationError) as exc_info:
+            config("name")
+        with pytest.raises(ValidationError) as expected:
+            config.models_by_field["name"].model_validate({"name": {"a": 1}})
+        assert str(exc_info.value) == str(expected.value)
+
+        assert config("options") == {"a": 1}
+
+
+def test_get_many_rules_by_pydantic():
+    """Tests that get_many validates some fields by the rules of get, and every field by the model itself"""
+
+    class WorkersModel(BaseModel):
+        workers: int = Field(default=1, gt=0)
+        name: str = "web"
+
+        def describe(self):
+            return "{} x{}".format(self.name, self.workers)
+
+    m = mock_open(read_data="workers=0\n")
+
+    with patch("builtins.open", m), patch("decouple.open", m):
+        config = ConfigByModel(crud.CRUDRepositoryEnv("/path/to/config_file"), WorkersModel)
+
+        assert config.get_many(["workers"]) == {"workers": config("workers")}
+        for kwargs in ({}, {"options": ["name", "workers"]}, {"options": ["name"], "as_model": True}):
+            with pytest.raises(ConfigValuesError) as exc_info:
+                config.get_many(**kwargs)
+            assert [error["loc"] for error in exc_info.value.errors] == [("workers",)]
+
+        config.repository.set("workers", "4")
+        assert config.get_many() == {"workers": 4, "name": "web"}
+        assert config.get_many(["name"], as_model=True).describe() == "web x4"
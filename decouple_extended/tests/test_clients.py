@@ -0,0 +1,46 @@
+import boto3
+from moto import mock_secretsmanager
+from moto import mock_ssm
+
+from decouple_extended.clients import ClientPool
+from decouple_extended.crud import CRUDRepositoryAWSSecrets
+from decouple_extended.repositories import RepositoryAWSParameterStore
+from decouple_extended.repositories import RepositoryAWSSecrets
+
+
+def test_client_pool():
+    """Tests that ClientPool hands out one client per service, region and profile"""
+    pool = ClientPool(max_pool_connections=50, retries={"max_attempts": 2, "mode": "standard"})
+
+    client = pool.get("ssm")
+    assert pool.get("ssm") is client
+    assert pool.get("ssm", region_name="eu-west-1") is not client
+    assert pool.get("secretsmanager") is not client
+    assert len(pool) == 3
+
+    assert client.meta.config.max_pool_connections == 50
+    assert client.meta.config.retries["mode"] == "standard"
+
+    pool.clear()
+    assert pool.get("ssm") is not client
+
+
+@mock_ssm
+@mock_secretsmanager
+def test_repositories_share_clients():
+    """Tests that AWS repositories reuse the clients of their pool unless given one"""
+    boto3.client("ssm").put_parameter(Name="parameter", Value='{"key": "value"}', Type="SecureString")
+    boto3.client("secretsmanager").create_secret(Name="first", SecretString="{}")
+    boto3.client("secretsmanager").create_secret(Name="second", SecretString="{}")
+
+    pool = ClientPool()
+    first = RepositoryAWSSecrets("first", client_pool=pool)
+    second = CRUDRepositoryAWSSecrets("second", client_pool=pool)
+    parameters = RepositoryAWSParameterStore("parameter", client_pool=pool)
+
+    assert first.client is second.client
+    assert parameters.client is not first.client
+    assert len(pool) == 2
+
+    client = boto3.client("ssm")
+    assert RepositoryAWSParameterStore("parameter", client=client).client is client
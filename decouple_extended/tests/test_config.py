@@ -1,10 +1,13 @@
+import asyncio
+import threading
+import time
 from unittest.mock import mock_open
 from unittest.mock import patch
 
 import boto3
 import pytest
 from moto import mock_secretsmanager  # noqa F401
-from moto import mock_ssm  # noqa F401
+from moto import mock_ssm
 
 from decouple_extended import crud
 
@@ -86,3 +89,57 @@ def test_crud_config_with_aws_repositories(repo_cls, aws_service, aws_method, aw
         assert "KEY1" not in config.repository
 
         assert config.list() == ["KEY2"]
+
+
+@mock_ssm
+def test_subscribe_aws_refresh():
+    """Tests that CRUDConfig subscribers run on the shared executor when a refresh changes their key"""
+    boto3.client("ssm").put_parameter(Name="config_data", Value='{"KEY1": "VALUE1"}', Type="SecureString")
+    config = crud.CRUDConfig(crud.CRUDRepositoryAWSParameterStore("config_data"))
+
+    notified = threading.Event()
+    changes = []
+    config.subscribe("KEY1", lambda *change: changes.append(change) or notified.set())
+
+    boto3.client("ssm").put_parameter(Name="config_data", Value='{"KEY1": "VALUE2"}', Type="SecureString", Overwrite=True)
+    config.repository.refresh()
+    assert notified.wait(5)
+    assert changes == [("KEY1", "VALUE1", "VALUE2")]
+
+
+@mock_ssm
+def test_crud_config_async():
+    """Tests that the async API of CRUDConfig works without blocking the event loop"""
+    boto3.client("ssm").put_parameter(Name="config_data", Value='{"KEY1": "VALUE1"}', Type="SecureString")
+    repository = crud.CRUDRepositoryAWSParameterStore("config_data", lazy=True)
+    config = crud.CRUDConfig(repository)
+    save_data = repository._save_data
+
+    def slow_save_data():
+        time.sleep(0.2)
+        save_data()
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        await repository.aload()
+        with patch.object(repository, "_save_data", side_effect=slow_save_data):
+            await config.aset("KEY2", "VALUE2")
+        ticker.cancel()
+        assert ticks > 5
+
+        boto3.client("ssm").put_parameter(Name="config_data", Value='{"KEY1": "NEWVALUE1"}', Type="SecureString", Overwrite=True)
+        await config.arefresh()
+        assert await config.aget("KEY1") == "NEWVALUE1"
+
+        await config.adelete("KEY1")
+        assert "KEY1" not in repository
+
+    asyncio.run(main())
@@ -1,10 +1,15 @@
+import json
+import threading
 from unittest.mock import mock_open
 from unittest.mock import patch
 
 import boto3
+import pytest
 from moto import mock_secretsmanager  # noqa F401
 from moto import mock_ssm  # noqa F401
 
+from decouple_extended.crud import ConfigConflictError
+from decouple_extended.crud import CRUDConfig
 from decouple_extended.crud import CRUDRepositoryAWSParameterStore
 from decouple_extended.crud import CRUDRepositoryAWSSecrets
 from decouple_extended.crud import CRUDRepositoryEnv
@@ -26,6 +31,9 @@ def test_crud_repository_aws_systems_manager():
     assert "key" in repo
     assert repo["key"] == "value"
 
+    # our own write is already loaded
+    assert repo.refresh() is False
+
     # list
     assert repo.list() == ["key"]
 
@@ -48,6 +56,9 @@ def test_crud_repository_aws_secrets():
     assert "secret_key" in repo
     assert repo["secret_key"] == "secret_value"
 
+    # our own write is already loaded
+    assert repo.refresh() is False
+
     # list
     assert repo.list() == ["secret_key"]
 
@@ -87,3 +98,258 @@ def test_crud_repository_ini():
 
         repo.delete("KEY")
         assert "KEY" not in repo
+
+
+@mock_secretsmanager
+def test_crud_repository_aws_secrets_batch():
+    """Tests that CRUDRepositoryAWSSecrets saves a batch of writes once and rolls it back on failure"""
+    secret_name = "test_secret"
+    secretsmanager = boto3.client("secretsmanager")
+    secretsmanager.create_secret(Name=secret_name, SecretString='{"key0": "value0"}')
+
+    config = CRUDConfig(CRUDRepositoryAWSSecrets(secret_name))
+    with patch.object(config.repository.client, "put_secret_value", wraps=config.repository.client.put_secret_value) as put_secret_value:
+        with config.batch():
+            for index in range(1, 50):
+                config.set("key{}".format(index), "value{}".format(index))
+            config.update("key0", "new_value0")
+            config.delete("key1")
+            put_secret_value.assert_not_called()
+        assert put_secret_value.call_count == 1
+
+    stored = json.loads(secretsmanager.get_secret_value(SecretId=secret_name)["SecretString"])
+    assert len(stored) == 49
+    assert stored["key0"] == "new_value0"
+    assert "key1" not in stored
+
+    with patch.object(config.repository.client, "put_secret_value", side_effect=RuntimeError("AWS is down")):
+        with pytest.raises(RuntimeError):
+            with config.batch():
+                config.set("key50", "value50")
+                config.delete("key0")
+    assert "key50" not in config.repository
+    assert config("key0") == "new_value0"
+
+
+@pytest.mark.parametrize(
+    "repo_cls,aws_service,aws_method,aws_kwargs",
+    [
+        (CRUDRepositoryAWSSecrets, "secretsmanager", "create_secret", {"SecretString": '{"KEY1": "VALUE1"}'}),
+        (CRUDRepositoryAWSParameterStore, "ssm", "put_parameter", {"Value": '{"KEY1": "VALUE1"}', "Type": "SecureString"}),
+    ],
+)
+def test_crud_aws_repositories_refresh_during_batch(repo_cls, aws_service, aws_method, aws_kwargs):
+    """Tests that a refresh while writes are pending keeps them, and they are saved with the other writer's"""
+    with globals()["mock_{}".format(aws_service)]():
+        getattr(boto3.client(aws_service), aws_method)(Name="config_data", **aws_kwargs)
+
+        repo = repo_cls("config_data")
+        other = repo_cls("config_data")
+        with repo.batch():
+            repo.set("MINE", "x")
+            other.set("OTHER", "y")
+            assert repo.refresh() is True
+            assert repo["MINE"] == "x"
+            assert repo["OTHER"] == "y"
+
+        stored = repo_cls("config_data")
+        assert stored.data == {"KEY1": "VALUE1", "MINE": "x", "OTHER": "y"}
+
+        # a failed batch only rolls back its own keys, not what a refresh loaded meanwhile
+        with patch.object(repo, "_save_data", side_effect=RuntimeError("AWS is down")):
+            with pytest.raises(RuntimeError):
+                with repo.batch():
+                    repo.delete("MINE")
+                    other.set("LATER", "z")
+                    repo.refresh()
+        assert repo.data == {"KEY1": "VALUE1", "MINE": "x", "OTHER": "y", "LATER": "z"}
+
+
+@mock_secretsmanager
+def test_crud_aws_repositories_write_from_other_thread_during_batch():
+    """Tests that a write from another thread waits for an open batch instead of joining it, and isn't rolled back with it"""
+    boto3.client("secretsmanager").create_secret(Name="config_data", SecretString='{"KEY1": "VALUE1"}')
+    repo = CRUDRepositoryAWSSecrets("config_data")
+    started = threading.Event()
+
+    def other_writer():
+        started.set()
+        repo.set("B", "b")
+
+    writer = threading.Thread(target=other_writer)
+    save_data = repo._save_data
+
+    def save_data_of_writer():
+        if threading.current_thread() is not writer:
+            raise RuntimeError("AWS is down")
+        save_data()
+
+    with patch.object(repo, "_save_data", side_effect=save_data_of_writer):
+        with pytest.raises(RuntimeError):
+            with repo.batch():
+                repo.set("A", "a")
+                writer.start()
+                started.wait()
+                writer.join(0.2)
+                assert writer.is_alive()
+    writer.join()
+
+    assert repo.data == {"KEY1": "VALUE1", "B": "b"}
+    assert CRUDRepositoryAWSSecrets("config_data").data == {"KEY1": "VALUE1", "B": "b"}
+
+
+@pytest.mark.parametrize(
+    "repo_cls,aws_service,aws_method,aws_kwargs",
+    [
+        (CRUDRepositoryAWSSecrets, "secretsmanager", "create_secret", {"SecretString": '{"KEY1": "VALUE1"}'}),
+        (CRUDRepositoryAWSParameterStore, "ssm", "put_parameter", {"Value": '{"KEY1": "VALUE1"}', "Type": "SecureString"}),
+    ],
+)
+def test_crud_aws_repositories_concurrent_writers(repo_cls, aws_service, aws_method, aws_kwargs):
+    """Tests that concurrent writers of the same AWS object don't drop each other's keys"""
+    with globals()["mock_{}".format(aws_service)]():
+        getattr(boto3.client(aws_service), aws_method)(Name="config_data", **aws_kwargs)
+
+        first = repo_cls("config_data")
+        second = repo_cls("config_data")
+
+        # second saves over a version it didn't load
+        first.set("KEY2", "VALUE2")
+        second.set("KEY3", "VALUE3")
+        assert second.conflicts == 1
+        assert second.data == {"KEY1": "VALUE1", "KEY2": "VALUE2", "KEY3": "VALUE3"}
+
+        # first saves right after second checked the stored version, so second's write drops first's
+        first.refresh()
+        save_data = second._save_data
+
+        def interleaved_save_data():
+            if "KEY4" not in first.data:
+                first.set("KEY4", "VALUE4")
+            save_data()
+
+        with patch.object(second, "_save_data", side_effect=interleaved_save_data):
+            second.delete("KEY1")
+        assert second.conflicts == 2
+
+        stored = repo_cls("config_data")
+        assert stored.data == {"KEY2": "VALUE2", "KEY3": "VALUE3", "KEY4": "VALUE4"}
+
+        # conflicts that keep happening end up raising
+        second.max_write_retries = 0
+        with patch.object(second, "_save_data", side_effect=lambda: first.set("KEY5", "VALUE5") or save_data()):
+            with pytest.raises(ConfigConflictError):
+                second.set("KEY6", "VALUE6")
+
+
+def test_crud_repository_env_log_structured(tmp_path):
+    """Tests that a log-structured CRUDRepositoryEnv only appends, and that compaction keeps comments and order"""
+    source = tmp_path / ".env"
+    source.write_text("# database\nDB_HOST=localhost\nDB_PORT=5432\n\n# cache\nCACHE=memcache\n")
+
+    repo = CRUDRepositoryEnv(str(source), log_structured=True)
+    repo.set("DB_PORT", "5433")
+    repo.delete("CACHE")
+    repo.set("DEBUG", "true")
+    assert source.read_text().endswith("DB_PORT=5433\nunset CACHE\nDEBUG=true\n")
+    assert repo.dead_lines == 3
+
+    # last write wins when loading, and tombstones remove keys
+    reloaded = CRUDRepositoryEnv(str(source), log_structured=True)
+    assert reloaded.data == {"DB_HOST": "localhost", "DB_PORT": "5433", "DEBUG": "true"}
+    assert reloaded.dead_lines == 3
+
+    # and so are they without log_structured, whether the file was just opened or reloaded
+    plain = CRUDRepositoryEnv(str(source))
+    assert plain.data == reloaded.data
+    assert plain.dead_lines == 0
+    plain._reload()
+    assert plain.data == reloaded.data
+
+    repo.compact()
+    assert source.read_text() == "# database\nDB_HOST=localhost\n\n# cache\nDB_PORT=5433\nDEBUG=true\n"
+    assert repo.dead_lines == 0
+
+    # compaction runs by itself past the threshold
+    repo.compact_threshold = 2
+    repo.set("DEBUG", "false")
+    assert repo.dead_lines == 1
+    repo.delete("DB_HOST")
+    assert repo.dead_lines == 0
+    assert source.read_text() == "# database\n\n# cache\nDB_PORT=5433\nDEBUG=false\n"
+
+
+@pytest.mark.parametrize(
+    "repo_cls,config_data",
+    [
+        (CRUDRepositoryIni, "[settings]\nKEY=VALUE\n"),
+        (CRUDRepositoryEnv, "# comment\nKEY=VALUE\n"),
+    ],
+)
+def test_crud_filebased_repositories_safe_writes(tmp_path, repo_cls, config_data):
+    """Tests that concurrent writers of one file don't lose each other's keys with safe_writes"""
+    source = tmp_path / "config"
+    source.write_text(config_data)
+
+    def write_keys(index):
+        repo = repo_cls(str(source), safe_writes=True)
+        for key_index in range(10):
+            repo.set("KEY_{}_{}".format(index, key_index), "VALUE")
+        repo.delete("KEY_{}_0".format(index))
+
+    threads = [threading.Thread(target=write_keys, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    repo = repo_cls(str(source))
+    keys = {key.upper() for key in repo.list()}
+    assert keys == {"KEY"} | {"KEY_{}_{}".format(index, key_index) for index in range(4) for key_index in range(1, 10)}
+    assert [path.name for path in tmp_path.iterdir() if path.name != "config.lock"] == ["config"]
+
+
+@pytest.mark.parametrize(
+    "repo_cls,config_data,new_config_data",
+    [
+        (CRUDRepositoryIni, "[settings]\nkey1=value1\nkey2=value2\n", "[settings]\nkey1=new_value1\nkey3=value3\n"),
+        (CRUDRepositoryEnv, "key1=value1\nkey2=value2\n", "key1=new_value1\nkey3=value3\n"),
+    ],
+)
+def test_crud_filebased_repositories_watch(tmp_path, repo_cls, config_data, new_config_data):
+    """Tests that watched file-based repositories pick up changes made by others, checking at most once per interval"""
+    source = tmp_path / "config"
+    source.write_text(config_data)
+
+    repo = repo_cls(str(source), watch_interval=60)
+    changes = []
+    repo.add_reload_listener(lambda *diff: changes.append(diff))
+    assert repo["key1"] == "value1"
+
+    source.write_text(new_config_data)
+    assert repo["key1"] == "value1"  # still within the interval
+
+    repo._watch_deadline = 0
+    assert repo["key1"] == "new_value1"
+    assert "key2" not in repo
+    assert changes == [(["key3"], ["key2"], ["key1"])]
+
+    # our own writes don't trigger a reload
+    repo.set("key4", "value4")
+    assert repo.check_for_changes() is False
+
+    # but don't hide the changes another writer made before them, even within the interval
+    repo_cls(str(source)).set("key5", "value5")
+    repo.set("key6", "value6")
+    assert repo.check_for_changes() is False
+    assert "key5" in repo
+
+    # a missing file keeps the values last loaded from it until it's back
+    source.unlink()
+    assert repo.check_for_changes() is False
+    repo._watch_deadline = 0
+    assert repo["key5"] == "value5"
+    source.write_text(new_config_data)
+    repo._watch_deadline = 0
+    assert "key5" not in repo
+    assert repo["key1"] == "new_value1"
@@ -0,0 +1,34 @@
+import subprocess
+import sys
+
+import decouple_extended
+
+
+def _loaded_modules(code):
+    # run in a fresh interpreter, as this one already imported everything
+    script = "import sys\n{}\nprint(' '.join(sorted(sys.modules)))".format(code)
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    return set(output.split())
+
+
+def test_file_repositories_dont_import_boto3_nor_pydantic():
+    """Tests that importing the env and ini CRUD classes leaves boto3 and pydantic unloaded"""
+    modules = _loaded_modules("from decouple_extended import CRUDConfig, CRUDRepositoryEnv, CRUDRepositoryIni")
+    assert "decouple_extended.crud" in modules
+    assert "boto3" not in modules
+    assert "botocore" not in modules
+    assert "pydantic" not in modules
+
+
+def test_aws_repositories_defer_boto3():
+    """Tests that boto3 is only imported once an AWS client is needed"""
+    modules = _loaded_modules("from decouple_extended import RepositoryAWSSecrets, CRUDRepositoryAWSSecrets")
+    assert "boto3" not in modules
+
+
+def test_lazy_attributes():
+    """Tests that every public name of the package can still be imported from it"""
+    for name in decouple_extended.__all__:
+        assert getattr(decouple_extended, name).__name__ == name
+    assert set(decouple_extended.__all__) <= set(dir(decouple_extended))
+    assert decouple_extended.CRUDConfigByModel is decouple_extended.crud.CRUDConfigByModel
@@ -0,0 +1,75 @@
+from typing import Optional
+
+import boto3
+import pytest
+from moto import mock_secretsmanager
+from pydantic import BaseModel
+from pydantic import ValidationError
+
+from decouple_extended.crud import CRUDConfig
+from decouple_extended.crud import CRUDRepositoryAWSSecrets
+from decouple_extended.crud import CRUDRepositoryEnv
+from decouple_extended.extensions import ConfigByModel
+from decouple_extended.observers import InMemoryObserver
+
+
+class ObservedModel(BaseModel):
+    PORT: Optional[int] = None
+    DEBUG: bool = False
+
+
+def test_config_observer(tmp_path, monkeypatch):
+    """Tests that configs report their gets, with the source of each value, and their casts to their observer"""
+    path = tmp_path / ".env"
+    path.write_text("PORT=8000\nNAME=web\n")
+    monkeypatch.setenv("DEBUG", "true")
+    observer = InMemoryObserver()
+
+    config = ConfigByModel(CRUDRepositoryEnv(str(path)), ObservedModel, observer=observer)
+    assert config("PORT") == 8000
+    assert config("PORT") == 8000
+    assert config("DEBUG") is True
+    assert config("UNDEFINED", default="x") == "x"
+    config.repository.set("PORT", "eighty")
+    with pytest.raises(ValidationError):
+        config("PORT")
+
+    assert observer.counts["get", "repository"] == 2
+    assert observer.counts["get", "environ"] == 1
+    assert observer.counts["get", "default"] == 1
+    assert observer.counts["get", "error"] == 1
+    # the second read of PORT was served from the cast cache
+    assert observer.counts["cast", "ok"] == 3
+    assert observer.counts["cast", "error"] == 1
+    assert observer.top_keys(1) == [("PORT", 3)]
+    assert sum(observer.snapshot()["histograms"]["get"].values()) == 5
+
+    config.observer = None
+    assert "get" not in config.__dict__
+    config("DEBUG")
+    assert observer.counts["get", "environ"] == 1
+
+    crud_config = CRUDConfig(config.repository, observer=observer)
+    assert crud_config("NAME") == "web"
+    assert observer.counts["get", "repository"] == 3
+
+
+@mock_secretsmanager
+def test_aws_repository_observer():
+    """Tests that AWS repositories report their loads and saves to their observer"""
+    boto3.client("secretsmanager").create_secret(Name="observed", SecretString='{"key": "value"}')
+    observer = InMemoryObserver()
+
+    repo = CRUDRepositoryAWSSecrets("observed", observer=observer)
+    repo.set("other", "value")
+    assert repo.refresh() is False
+
+    assert observer.counts["load", "ok"] == 2
+    assert observer.counts["save", "ok"] == 1
+    assert observer.payload_bytes["load"] == len('{"key": "value"}')
+    assert observer.payload_bytes["save"] == len('{"key": "value", "other": "value"}')
+
+    repo.client = None
+    with pytest.raises(AttributeError):
+        repo.refresh()
+    assert observer.counts["load", "error"] == 1
@@ -1,11 +1,25 @@
+import os
+import threading
+import time
+from types import MappingProxyType
+from unittest.mock import patch
+
 import boto3
 import pytest
+from botocore.exceptions import ClientError
 from decouple import UndefinedValueError
 from moto import mock_secretsmanager
 from moto import mock_ssm
 
+from decouple_extended.crud import CRUDConfig
+from decouple_extended.crud import CRUDRepositoryAWSSecrets
+from decouple_extended.crud import CRUDRepositoryEnv
+from decouple_extended.crud import CRUDRepositoryIni
 from decouple_extended.repositories import RepositoryAWSParameterStore
+from decouple_extended.repositories import RepositoryAWSParameterStorePath
 from decouple_extended.repositories import RepositoryAWSSecrets
+from decouple_extended.repositories import RepositoryAWSSecretsMulti
+from decouple_extended.repositories import RepositoryChain
 
 
 @mock_ssm
@@ -36,3 +50,312 @@ def test_repository_aws_secrets():
 
     with pytest.raises(UndefinedValueError):
         _ = repo["undefined_key"]
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@mock_secretsmanager
+def test_repository_aws_secrets_refresh():
+    """Tests that RepositoryAWSSecrets picks up rotated values in the background and survives failed fetches"""
+    secret_name = "test_secret"
+    secretsmanager = boto3.client("secretsmanager")
+    secretsmanager.create_secret(Name=secret_name, SecretString='{"secret_key": "secret_value"}')
+
+    repo = RepositoryAWSSecrets(secret_name, refresh_interval=0.01)
+    try:
+        secretsmanager.put_secret_value(SecretId=secret_name, SecretString='{"secret_key": "rotated_value"}')
+        assert wait_until(lambda: repo["secret_key"] == "rotated_value")
+
+        secretsmanager.delete_secret(SecretId=secret_name, ForceDeleteWithoutRecovery=True)
+        time.sleep(0.05)
+        assert repo["secret_key"] == "rotated_value"
+    finally:
+        repo.stop_refresh()
+
+
+@mock_ssm
+def test_repository_aws_systems_manager_refresh():
+    """Tests that RepositoryAWSParameterStore can be refreshed on demand"""
+    parameter_store_name = "test_parameter_store"
+    ssm = boto3.client("ssm")
+    ssm.put_parameter(Name=parameter_store_name, Value='{"key": "value"}', Type="SecureString")
+
+    repo = RepositoryAWSParameterStore(parameter_store_name)
+    assert repo.version == 1
+    ssm.put_parameter(Name=parameter_store_name, Value='{"key": "new_value"}', Type="SecureString", Overwrite=True)
+    assert repo["key"] == "value"
+
+    assert repo.refresh() is True
+    assert repo["key"] == "new_value"
+    assert repo.version == 2
+
+    # an unchanged version keeps the loaded data as is
+    data = repo.data
+    assert repo.refresh() is False
+    assert repo.data is data
+
+
+@mock_secretsmanager
+def test_repository_aws_secrets_version():
+    """Tests that RepositoryAWSSecrets only downloads the secret again when its version changed"""
+    secret_name = "test_secret"
+    secretsmanager = boto3.client("secretsmanager")
+    secretsmanager.create_secret(Name=secret_name, SecretString='{"secret_key": "secret_value"}')
+
+    repo = RepositoryAWSSecrets(secret_name)
+    version = repo.version
+    assert version is not None
+
+    with patch.object(repo.client, "get_secret_value", wraps=repo.client.get_secret_value) as get_secret_value:
+        assert repo.refresh() is False
+        get_secret_value.assert_not_called()
+
+        secretsmanager.put_secret_value(SecretId=secret_name, SecretString='{"secret_key": "rotated_value"}')
+        assert repo.refresh() is True
+        assert get_secret_value.call_count == 1
+
+    assert repo.version != version
+    assert repo["secret_key"] == "rotated_value"
+
+
+@mock_secretsmanager
+def test_repository_aws_secrets_local_cache(tmp_path):
+    """Tests that RepositoryAWSSecrets starts from a fresh local cache and falls back to a stale one when throttled"""
+    secret_name = "test_secret"
+    cache_path = str(tmp_path / "secret.json")
+    secretsmanager = boto3.client("secretsmanager")
+    secretsmanager.create_secret(Name=secret_name, SecretString='{"secret_key": "secret_value"}')
+
+    RepositoryAWSSecrets(secret_name, cache_path=cache_path)
+    secretsmanager.delete_secret(SecretId=secret_name, ForceDeleteWithoutRecovery=True)
+
+    # a fresh cache is used even though AWS can't serve the secret anymore
+    repo = RepositoryAWSSecrets(secret_name, cache_path=cache_path, cache_max_age=60)
+    assert repo["secret_key"] == "secret_value"
+
+    # a stale cache is only used when AWS throttles
+    os.utime(cache_path, (time.time() - 120, time.time() - 120))
+    with pytest.raises(ClientError):
+        RepositoryAWSSecrets(secret_name, cache_path=cache_path, cache_max_age=60)
+
+    throttled = ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "GetSecretValue")
+    with patch("botocore.client.BaseClient._make_api_call", side_effect=throttled):
+        repo = RepositoryAWSSecrets(secret_name, cache_path=cache_path, cache_max_age=60)
+    assert repo["secret_key"] == "secret_value"
+
+
+@mock_ssm
+def test_repository_aws_systems_manager_encrypted_cache(tmp_path, monkeypatch):
+    """Tests that RepositoryAWSParameterStore encrypts its local cache with the key from the environment"""
+    fernet = pytest.importorskip("cryptography.fernet")
+    parameter_store_name = "test_parameter_store"
+    cache_path = str(tmp_path / "parameter.json")
+    monkeypatch.setenv("CONFIG_CACHE_KEY", fernet.Fernet.generate_key().decode())
+    ssm = boto3.client("ssm")
+    ssm.put_parameter(Name=parameter_store_name, Value='{"key": "value"}', Type="SecureString")
+
+    RepositoryAWSParameterStore(parameter_store_name, cache_path=cache_path, cache_key_env="CONFIG_CACHE_KEY")
+    with open(cache_path, "rb") as file_:
+        assert b"value" not in file_.read()
+    assert os.stat(cache_path).st_mode & 0o777 == 0o600
+
+    ssm.delete_parameter(Name=parameter_store_name)
+    repo = RepositoryAWSParameterStore(parameter_store_name, cache_path=cache_path, cache_key_env="CONFIG_CACHE_KEY")
+    assert repo["key"] == "value"
+    assert repo.version == 1
+
+
+@mock_secretsmanager
+def test_repository_aws_secrets_lazy():
+    """Tests that a lazy RepositoryAWSSecrets only reaches AWS once, on first access"""
+    secret_name = "lazy_secret"
+    secretsmanager = boto3.client("secretsmanager")
+    secretsmanager.create_secret(Name=secret_name, SecretString='{"secret_key": "secret_value"}')
+
+    with patch("botocore.client.BaseClient._make_api_call", autospec=True, side_effect=lambda *args: time.sleep(0.05) or {}) as api_call:
+        repo = RepositoryAWSSecrets(secret_name, lazy=True)
+        assert "client" not in vars(repo)
+        api_call.assert_not_called()
+
+        threads = [threading.Thread(target=lambda: "secret_key" in repo) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # background threads of other repositories may also be calling AWS
+        assert [call.args[2] for call in api_call.call_args_list].count({"SecretId": secret_name}) == 1
+
+    repo = RepositoryAWSSecrets(secret_name, lazy=True)
+    assert repo["secret_key"] == "secret_value"
+
+
+@mock_ssm
+def test_repository_aws_systems_manager_path():
+    """Tests that RepositoryAWSParameterStorePath loads every parameter under a path as one option each"""
+    ssm = boto3.client("ssm")
+    for index in range(25):
+        ssm.put_parameter(Name="/app/prod/KEY{}".format(index), Value="value{}".format(index), Type="SecureString")
+    ssm.put_parameter(Name="/app/prod/db/HOST", Value="localhost", Type="String")
+    ssm.put_parameter(Name="/app/staging/KEY0", Value="staging", Type="String")
+
+    repo = RepositoryAWSParameterStorePath("/app/prod/")
+    assert len(repo.data) == 26
+    assert repo["KEY0"] == "value0"
+    assert repo["KEY24"] == "value24"
+    assert repo["db/HOST"] == "localhost"
+
+    with pytest.raises(UndefinedValueError):
+        _ = repo["undefined_key"]
+
+    assert repo.refresh() is False
+    ssm.put_parameter(Name="/app/prod/KEY0", Value="new_value", Type="SecureString", Overwrite=True)
+    assert repo.refresh() is True
+    assert repo["KEY0"] == "new_value"
+
+    repo = RepositoryAWSParameterStorePath("/app/prod", recursive=False)
+    assert "db/HOST" not in repo
+    assert "KEY0" in repo
+
+
+@mock_secretsmanager
+def test_repository_aws_secrets_multi():
+    """Tests that RepositoryAWSSecretsMulti merges several secrets, later ones taking precedence"""
+    secretsmanager = boto3.client("secretsmanager")
+    secretsmanager.create_secret(Name="shared", SecretString='{"key1": "shared1", "key2": "shared2"}')
+    secretsmanager.create_secret(Name="service", SecretString='{"key2": "service2", "key3": "service3"}')
+
+    repo = RepositoryAWSSecretsMulti(["shared", "service"])
+    assert repo.data == {"key1": "shared1", "key2": "service2", "key3": "service3"}
+    assert repo.sources == {"key1": "shared", "key2": "service", "key3": "service"}
+
+    with pytest.raises(UndefinedValueError):
+        _ = repo["undefined_key"]
+
+    assert repo.refresh() is False
+    secretsmanager.put_secret_value(SecretId="shared", SecretString='{"key1": "new1"}')
+    assert repo.refresh() is True
+    assert repo.data == {"key1": "new1", "key2": "service2", "key3": "service3"}
+
+    # with BatchGetSecretValue available, all the secrets come in one call
+    secret_values = [dict(secretsmanager.get_secret_value(SecretId=name), Name=name) for name in ("service", "shared")]
+    with patch.object(repo.client, "batch_get_secret_value", create=True, return_value={"SecretValues": secret_values}) as batch:
+        with patch.object(repo.client, "get_secret_value") as get_secret_value:
+            repo = RepositoryAWSSecretsMulti(["shared", "service"])
+    batch.assert_called_once_with(SecretIdList=["shared", "service"])
+    get_secret_value.assert_not_called()
+    assert repo.sources == {"key1": "shared", "key2": "service", "key3": "service"}
+
+
+@mock_ssm
+@mock_secretsmanager
+def test_repository_chain(tmp_path):
+    """Tests that RepositoryChain merges its layers by precedence and follows their changes"""
+    boto3.client("ssm").put_parameter(Name="config_data", Value='{"KEY1": "ssm1", "KEY2": "ssm2", "KEY3": "ssm3"}', Type="SecureString")
+    boto3.client("secretsmanager").create_secret(Name="secret", SecretString='{"KEY3": "secret3", "KEY4": "secret4"}')
+    source = tmp_path / ".env"
+    source.write_text("KEY1=env1\n")
+
+    env = CRUDRepositoryEnv(str(source))
+    parameters = RepositoryAWSParameterStore("config_data")
+    secrets = RepositoryAWSSecrets("secret")
+    chain = RepositoryChain([{"KEY0": "local0"}, env, parameters, secrets])
+
+    assert chain.data == {"KEY0": "local0", "KEY1": "env1", "KEY2": "ssm2", "KEY3": "ssm3", "KEY4": "secret4"}
+    assert chain.source_of("KEY1") is env
+    assert chain.source_of("KEY3") is parameters
+    with pytest.raises(UndefinedValueError):
+        _ = chain["undefined_key"]
+
+    # changes reported by a layer are merged right away
+    env.set("KEY2", "env2")
+    assert chain["KEY2"] == "env2"
+    env.delete("KEY1")
+    assert chain["KEY1"] == "ssm1"
+    assert chain.source_of("KEY1") is parameters
+
+    boto3.client("ssm").put_parameter(Name="config_data", Value='{"KEY1": "ssm1"}', Type="SecureString", Overwrite=True)
+    parameters.refresh()
+    assert chain["KEY3"] == "secret3"
+    assert chain.source_of("KEY3") is secrets
+
+
+def test_repository_chain_ini(tmp_path):
+    """Tests that ini layers of a RepositoryChain still match keys whatever their case"""
+    source = tmp_path / "settings.ini"
+    source.write_text("[settings]\nDEBUG=true\nNAME=ini\n")
+
+    ini = CRUDRepositoryIni(str(source))
+    chain = RepositoryChain([{"NAME": "local", "debug": "local"}, ini])
+
+    assert CRUDConfig(chain)("DEBUG") == CRUDConfig(ini)("DEBUG") == "true"
+    assert chain.source_of("DEBUG") is ini
+    assert chain["NAME"] == "local"
+    assert chain["debug"] == "local"
+
+    ini.set("NEW", "value")
+    assert "NEW" not in chain.data
+    assert chain["NEW"] == chain["new"] == "value"
+    assert chain.source_of("New") is ini
+
+    ini.delete("NEW")
+    assert "new" not in chain
+    assert "NEW" not in chain
+
+
+@mock_secretsmanager
+def test_repository_aws_secrets_preload():
+    """Tests that a preloaded repository keeps read-only data, which forked processes read without AWS calls"""
+    boto3.client("secretsmanager").create_secret(Name="preloaded", SecretString='{"key": "value"}')
+
+    repo = RepositoryAWSSecrets("preloaded", preload=True, refresh_interval=3600)
+    assert isinstance(repo.data, MappingProxyType)
+    with pytest.raises(TypeError):
+        repo.data["key"] = "other"
+    parent_client = repo.client
+
+    pid = os.fork()
+    if pid == 0:
+        # in the child: the client is only created again when AWS has to be called
+        ok = False
+        try:
+            ok = "client" not in repo.__dict__ and repo["key"] == "value" and repo._refreshing
+            ok = ok and repo.refresh() is False and repo.client is not parent_client
+        finally:
+            os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    assert repo.client is parent_client
+    repo.stop_refresh()
+
+    crud_repo = CRUDRepositoryAWSSecrets("preloaded", preload=True)
+    crud_repo.set("other", "value")
+    assert crud_repo.data == {"key": "value", "other": "value"}
+    assert crud_repo.refresh() is False
+
+
+@mock_secretsmanager
+def test_repository_aws_secrets_failing_listener():
+    """Tests that a failing listener doesn't keep the other listeners nor keys from being notified"""
+    secretsmanager = boto3.client("secretsmanager")
+    secretsmanager.create_secret(Name="listened", SecretString='{"a": "1", "b": "1"}')
+
+    repo = RepositoryAWSSecrets("listened")
+    changed = []
+
+    def failing_listener(key):
+        raise ValueError(key)
+
+    repo.add_listener(failing_listener)
+    repo.add_listener(changed.append)
+
+    secretsmanager.put_secret_value(SecretId="listened", SecretString='{"a": "2", "b": "2"}')
+    assert repo.refresh() is True
+    assert changed == ["a", "b"]